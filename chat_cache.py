@@ -0,0 +1,184 @@
+"""
+Cache for chat completion outputs, keyed on the request that produced them.
+
+Two tiers: an in-memory LRU, and optionally a SQLite file that survives
+restarts, capped by total stored bytes (least recently used entries go
+first). Entries older than the TTL count as misses in both tiers.
+
+Disk hits don't write on their own: access times are batched and written
+with the next put, every TOUCH_BATCH hits, or on close(). The database
+runs in WAL mode with synchronous=NORMAL, so a commit doesn't fsync.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Request fields that decide what the model returns
+KEY_FIELDS = ("model", "messages", "response_format", "temperature", "max_tokens")
+
+
+def cache_key(request):
+    """Stable hash of the output-relevant fields of a chat.completions.create request."""
+    fields = {name: request.get(name) for name in KEY_FIELDS}
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Disk hits whose access times are held before being written out
+    TOUCH_BATCH = 256
+
+    def __init__(self, max_entries=10000, path=None, max_bytes=256 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._memory = OrderedDict()  # {key: (content, created)}
+        self._touched = {}  # {key: accessed} not yet written to disk
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self._db.commit()
+            # Running total, so eviction doesn't have to re-sum the table on every put
+            self._disk_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.stores = 0
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, request):
+        """Return the cached content for a request, or None."""
+        key = cache_key(request)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT content, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    content, created = row
+                    if not self._expired(created, now):
+                        self._touched[key] = now
+                        if len(self._touched) >= self.TOUCH_BATCH:
+                            self._write_touches()
+                            self._db.commit()
+                        self._remember(key, content, created)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return content
+                    self._delete(key)
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, request, content):
+        """Store content for a request. Only store outputs that passed validation."""
+        key = cache_key(request)
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            self.stores += 1
+            if self._db is not None:
+                self._delete(key)
+                self._touched.pop(key, None)
+                self._write_touches()
+                size = len(content.encode("utf-8"))
+                self._db.execute(
+                    "INSERT INTO responses VALUES (?, ?, ?, ?, ?)", (key, content, size, now, now)
+                )
+                self._disk_bytes += size
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _remember(self, key, content, created):
+        self._memory[key] = (content, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _write_touches(self):
+        # Before any eviction, so it goes by up-to-date access times
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _delete(self, key):
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _evict_disk(self, now):
+        if self.ttl is not None:
+            cutoff = now - self.ttl
+            expired = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+            ).fetchone()[0]
+            if expired:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self._disk_bytes -= expired
+        if self._disk_bytes <= self.max_bytes:
+            return
+        # Drop least recently used rows until back under the byte budget
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed")
+        victims = []
+        for key, size in rows:
+            if self._disk_bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "stores": self.stores,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes if self._db is not None else 0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._write_touches()
+                self._db.commit()
+                self._db.close()
+                self._db = None
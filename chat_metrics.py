@@ -0,0 +1,146 @@
+"""
+Latency metrics for chat completion calls.
+
+A RequestTimer follows one call and records into a ChatMetrics:
+  ttft_seconds         request sent -> first content token (queue + prefill)
+  inter_token_seconds  gap between consecutive content chunks (decode)
+  tokens_per_second    chunks after the first / time from first to last chunk
+  total_seconds        request sent -> response fully received
+  validation_seconds   JSON parsing + CodeResponse validation
+
+Each metric goes into a log-bucketed histogram, so memory stays fixed no
+matter how many calls are observed. Percentiles are accurate to about 5%.
+"""
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS = (
+    "ttft_seconds",
+    "inter_token_seconds",
+    "tokens_per_second",
+    "total_seconds",
+    "validation_seconds",
+)
+
+
+class Histogram:
+    # Bucket i covers [MIN * GROWTH**i, MIN * GROWTH**(i+1))
+    MIN = 1e-6
+    GROWTH = 1.1
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        index = 0
+        if value > self.MIN:
+            index = int(math.log(value / self.MIN, self.GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric midpoint of the bucket, clamped to what was observed
+                value = self.MIN * self.GROWTH ** (index + 0.5)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class ChatMetrics:
+    def __init__(self):
+        self.histograms = {name: Histogram() for name in METRICS}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix="openai_chat_"):
+        """Prometheus text exposition format, one summary per metric."""
+        lines = []
+        for name, summary in self.summary().items():
+            metric = prefix + name
+            lines.append(f"# TYPE {metric} summary")
+            for q, field in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                value = summary[field]
+                lines.append(f'{metric}{{quantile="{q}"}} {"NaN" if value is None else value}')
+            lines.append(f"{metric}_sum {summary['sum']}")
+            lines.append(f"{metric}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """Times one chat call. With metrics=None every method is a no-op."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.last_token = None
+        self.tokens = 0
+
+    def token(self):
+        """Call once per content chunk as it arrives."""
+        if self.metrics is None:
+            return
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            self.metrics.observe("ttft_seconds", now - self.start)
+        else:
+            self.metrics.observe("inter_token_seconds", now - self.last_token)
+        self.last_token = now
+        self.tokens += 1
+
+    @contextmanager
+    def validation(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("validation_seconds", time.perf_counter() - start)
+
+    def finish(self):
+        """Record total time, and decode speed if tokens were streamed."""
+        if self.metrics is None:
+            return
+        self.metrics.observe("total_seconds", time.perf_counter() - self.start)
+        # The first token arrives at first_token; the rest are the decode
+        if self.first_token is not None and self.last_token > self.first_token:
+            decode = self.last_token - self.first_token
+            self.metrics.observe("tokens_per_second", (self.tokens - 1) / decode)
@@ -1,7 +1,11 @@
 """
 input() should be write one character , or several space to break when input done. 
 """
-from typing import List, ValuesView
+import mmap
+import struct
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, List, TextIO, Tuple, Union
 
 # Implement the print method.
 # The major constraint here is that storage in the filesystem consists of a fixed size list of blocks.
@@ -10,7 +14,15 @@ from typing import List, ValuesView
 
 # Add write and read methods. 
 # Write data at position pos, read n bytes starting at position pos.
-# n, pos, len(data) must always be a multiple of 8 chars.
+# pos, n and len(data) may be any byte offsets; partial blocks are handled here.
+
+BLOCK_SIZE = 8
+
+# Image file layout: header (magic, block size, block count), padded to a
+# page so the block data that follows is page aligned
+IMAGE_MAGIC = b"FSIMG001"
+IMAGE_HEADER = struct.Struct("<8sIQ")
+IMAGE_DATA_OFFSET = 4096
 
 class Node:
     def __init__(self, data: str):
@@ -18,46 +30,599 @@ class Node:
         self.data = data
             
 
+class BlockCache:
+    """LRU write-back cache of blocks in front of a block store.
+
+    Writes only touch cached copies. Dirty blocks reach the store when they
+    are evicted or on flush(), and each run of adjacent dirty blocks goes
+    out as a single slice assignment.
+    """
+    def __init__(self, store, capacity: int):
+        if capacity < 1:
+            raise ValueError("Cache needs room for at least one block")
+        self.store = store
+        self.capacity = capacity
+        self.blocks = OrderedDict()  # block index -> bytearray(BLOCK_SIZE)
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0  # slice assignments made to the store
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def dirty_blocks(self) -> int:
+        return len(self.dirty)
+
+    def _block(self, i: int, overwrite: bool = False) -> bytearray:
+        block = self.blocks.get(i)
+        if block is not None:
+            self.hits += 1
+            self.blocks.move_to_end(i)
+            return block
+        self.misses += 1
+        # A block about to be fully overwritten doesn't need fetching
+        if overwrite:
+            block = bytearray(BLOCK_SIZE)
+        else:
+            block = bytearray(self.store[i*BLOCK_SIZE:(i+1)*BLOCK_SIZE])
+        self.blocks[i] = block
+        while len(self.blocks) > self.capacity:
+            self._evict()
+        return block
+
+    def _evict(self) -> None:
+        i, _ = next(iter(self.blocks.items()))
+        if i in self.dirty:
+            self._write_back_run(i)
+        del self.blocks[i]
+
+    def _write_back_run(self, i: int) -> None:
+        # Extend to the whole run of adjacent dirty blocks around i
+        first = last = i
+        while first-1 in self.dirty:
+            first -= 1
+        while last+1 in self.dirty:
+            last += 1
+        self.store[first*BLOCK_SIZE:(last+1)*BLOCK_SIZE] = b"".join(
+            self.blocks[j] for j in range(first, last+1))
+        self.dirty.difference_update(range(first, last+1))
+        self.writebacks += 1
+
+    def read(self, pos: int, n: int) -> bytearray:
+        out = bytearray(n)
+        end = pos+n
+        while pos < end:
+            i, offset = divmod(pos, BLOCK_SIZE)
+            take = min(BLOCK_SIZE-offset, end-pos)
+            out[n-(end-pos):n-(end-pos)+take] = self._block(i)[offset:offset+take]
+            pos += take
+        return out
+
+    def write(self, pos: int, data: bytes) -> None:
+        done = 0
+        while done < len(data):
+            i, offset = divmod(pos+done, BLOCK_SIZE)
+            take = min(BLOCK_SIZE-offset, len(data)-done)
+            block = self._block(i, overwrite=take == BLOCK_SIZE)
+            block[offset:offset+take] = data[done:done+take]
+            self.dirty.add(i)
+            done += take
+
+    def flush(self) -> None:
+        for i in sorted(self.dirty):
+            if i in self.dirty:
+                self._write_back_run(i)
+
+
 class Filesystem():
-    def __init__(self, nodes:List[Node]):
-        self.nodes = nodes
-    # nodes: List[Node]
-    def print(self):
-        # pass
-        res = []
-        for node in self.nodes:
-            c = list(node.data)
-            res.append(f"[{','.join(c)}]")
-        print(f"[{', '.join(res)}]")
+    def __init__(self, nodes:List[Node], cache_blocks: int = 0):
+        # All blocks live back to back in one bytearray: block i is
+        # self.data[i*8:(i+1)*8], one byte per char (latin-1)
+        self.data = bytearray()
+        self._file = None
+        self._mmap = None
+        for node in nodes:
+            if len(node.data) != BLOCK_SIZE:
+                raise ValueError(f"Block must be {BLOCK_SIZE} chars, got {node.data!r}")
+            self.data += node.data.encode("latin-1")
+        self.cache = BlockCache(self.data, cache_blocks) if cache_blocks else None
+
+    @classmethod
+    def create_image(cls, path: str, num_blocks: int, cache_blocks: int = 0) -> "Filesystem":
+        """Create a zero-filled image file of num_blocks blocks and open it."""
+        with open(path, "wb") as f:
+            f.write(IMAGE_HEADER.pack(IMAGE_MAGIC, BLOCK_SIZE, num_blocks))
+            # Sparse on most filesystems: no data is written for the blocks
+            f.truncate(IMAGE_DATA_OFFSET + num_blocks*BLOCK_SIZE)
+        return cls.open_image(path, cache_blocks)
+
+    @classmethod
+    def open_image(cls, path: str, cache_blocks: int = 0) -> "Filesystem":
+        """Open an image file; blocks are mapped, not read, so this is instant at any size."""
+        f = open(path, "r+b")
+        mm = None
+        try:
+            try:
+                mm = mmap.mmap(f.fileno(), 0)
+            except ValueError:
+                # Empty files can't be mapped
+                raise ValueError(f"{path} is not a filesystem image") from None
+            if len(mm) < IMAGE_HEADER.size:
+                raise ValueError(f"{path} is not a filesystem image")
+            magic, block_size, num_blocks = IMAGE_HEADER.unpack_from(mm, 0)
+            end = IMAGE_DATA_OFFSET + num_blocks*block_size
+            if magic != IMAGE_MAGIC or block_size != BLOCK_SIZE or len(mm) < end:
+                raise ValueError(f"{path} is not a filesystem image with {BLOCK_SIZE}-char blocks")
+        except BaseException:
+            if mm is not None:
+                mm.close()
+            f.close()
+            raise
+
+        fs = cls([])
+        fs._file = f
+        fs._mmap = mm
+        # Same slicing interface as the bytearray, straight over mapped pages
+        fs.data = memoryview(mm)[IMAGE_DATA_OFFSET:end]
+        fs.cache = BlockCache(fs.data, cache_blocks) if cache_blocks else None
+        return fs
+
+    def flush(self) -> None:
+        """Write back dirty cached blocks, then mapped pages to the image file (msync)."""
+        if self.cache is not None:
+            self.cache.flush()
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self) -> None:
+        """Flush and unmap the image. Views returned by read() must be released first.
 
-    def read(self, pos: int, n: int) -> str:
+        If one is still alive this raises BufferError and the image stays open.
+        """
+        if self._mmap is None:
+            return
+        self.flush()
+        size = len(self.data)
+        self.data.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Put the view back so the filesystem is still usable
+            self.data = memoryview(self._mmap)[IMAGE_DATA_OFFSET:IMAGE_DATA_OFFSET+size]
+            if self.cache is not None:
+                self.cache.store = self.data
+            raise
+        self._file.close()
+        self._mmap = None
+        self.data = bytearray()
+        self.cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_blocks(self) -> int:
+        return len(self.data) // BLOCK_SIZE
+
+    def print(self, file: TextIO = None):
         # pass
-        if (pos+n) > len(self.nodes)*8:
-            raise ValueError("Read data larger than data size")
-        start_i = pos//8
-        num_blocks = n//8
-        return ''.join([node.data for node in self.nodes[start_i:start_i+num_blocks]])
+        self.dump(sys.stdout if file is None else file)
+
+    def dump(self, file: TextIO, chunk_blocks: int = 4096) -> None:
+        """Write the print() format to file, chunk_blocks blocks at a time.
+
+        Only one chunk is formatted at once, so memory use doesn't grow
+        with the size of the filesystem.
+        """
+        if self.cache is not None:
+            self.cache.flush()
+        file.write("[")
+        chunk_bytes = chunk_blocks*BLOCK_SIZE
+        for start in range(0, len(self.data), chunk_bytes):
+            chunk = bytes(self.data[start:start+chunk_bytes]).decode("latin-1")
+            res = []
+            for i in range(0, len(chunk), BLOCK_SIZE):
+                c = chunk[i:i+BLOCK_SIZE]
+                res.append(f"[{','.join(c)}]")
+            if start:
+                file.write(", ")
+            file.write(", ".join(res))
+        file.write("]\n")
+
+    def _check_range(self, pos: int, n: int, what: str) -> None:
+        if pos < 0 or n < 0 or pos+n > len(self.data):
+            raise ValueError(f"{what} data larger than data size")
+
+    def read(self, pos: int, n: int) -> memoryview:
+        # Uncached reads are zero-copy views into the block store that
+        # reflect later writes; cached reads are assembled from the cache
+        self._check_range(pos, n, "Read")
+        if self.cache is not None:
+            return memoryview(self.cache.read(pos, n))
+        return memoryview(self.data)[pos:pos+n]
     
-    def write(self, pos: int, data: str) -> None:
-        # pass
-        start_i = pos//8
-        num_blocks = len(data)//8
-        if start_i+num_blocks > len(self.nodes):
-            raise ValueError("Write data larger than data size")
-        for i in range(start_i, start_i+num_blocks):
-            chunk = data[(i-start_i)*8:(i-start_i+1)*8]
-            self.nodes[i].data = chunk
-
-fs = Filesystem([
-        Node("abcdefgh"), 
-        Node("ijklmnop")
-    ])
-
-
-fs.print()
-fs.write(8,"12345678")
-fs.print()
-print(fs.read(8,8))
-# print(fs.read(8,16))
-# fs.write(8,"1234567812345678")
+    def write(self, pos: int, data: Union[str, bytes]) -> None:
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        self._check_range(pos, len(data), "Write")
+        if self.cache is not None:
+            self.cache.write(pos, data)
+        else:
+            self.data[pos:pos+len(data)] = data
+
+    @staticmethod
+    def _spans(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int, List[int], bool]]:
+        # Merge (pos, n) ranges that overlap, touch or share a block into
+        # (start, end, indexes of the ranges inside, whether they cover the
+        # span with no gaps) spans, in position order
+        spans = []
+        for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+            pos, n = ranges[i]
+            if spans and (pos <= spans[-1][1] or pos//BLOCK_SIZE <= (spans[-1][1]-1)//BLOCK_SIZE):
+                span = spans[-1]
+                if pos > span[1]:
+                    span[3] = False
+                span[1] = max(span[1], pos+n)
+                span[2].append(i)
+            else:
+                spans.append([pos, pos+n, [i], True])
+        return spans
+
+    def readv(self, ranges: Iterable[Tuple[int, int]]) -> List[memoryview]:
+        """Read many (pos, n) ranges, returning views in the order given.
+
+        Ranges that overlap, touch or share a block are merged so each block
+        is read once.
+        """
+        ranges = list(ranges)
+        out = [None]*len(ranges)
+        for start, end, members, _ in self._spans(ranges):
+            span = self.read(start, end-start)
+            for i in members:
+                pos, n = ranges[i]
+                out[i] = span[pos-start:pos-start+n]
+        return out
+
+    def writev(self, writes: Iterable[Tuple[int, Union[str, bytes]]]) -> None:
+        """Apply many (pos, data) writes with one write per merged span.
+
+        Writes that overlap, touch or share a block are merged, so each block
+        is written once. Where writes overlap, the later one in the list
+        wins, as if they had been written one by one.
+        """
+        writes = [(pos, data.encode("latin-1") if isinstance(data, str) else data)
+                  for pos, data in writes]
+        for pos, data in writes:
+            self._check_range(pos, len(data), "Write")
+        for start, end, members, gapless in self._spans([(pos, len(data)) for pos, data in writes]):
+            # Bytes between writes that only share a block keep their contents
+            buf = bytearray(end-start) if gapless else bytearray(self.read(start, end-start))
+            for i in sorted(members):
+                pos, data = writes[i]
+                buf[pos-start:pos-start+len(data)] = data
+            self.write(start, buf)
+
+
+class ExtentAllocator:
+    """Hands out runs of contiguous blocks (extents) from a free-space bitmap.
+
+    Free space is also indexed as extents: by start and by end (to merge
+    neighbours in O(1) when blocks are freed) and by length (for best fit).
+    A bit tree over lengths finds the smallest free length that fits in
+    O(log num_blocks), so allocate, extend and free are all logarithmic.
+    Best fit keeps large free runs intact for large files.
+    """
+    def __init__(self, num_blocks: int):
+        self.num_blocks = num_blocks
+        self.bitmap = bytearray((num_blocks+7)//8)  # bit set = block in use
+        self.free_blocks = num_blocks
+        self._lengths = {}  # free extent start -> length
+        self._ends = {}  # free extent end -> start
+        self._by_length = {}  # length -> set of starts
+        # Node i is nonzero if some free extent has a length in its subtree;
+        # leaf _leaves+length stands for that length
+        self._leaves = 1 << num_blocks.bit_length()
+        self._tree = bytearray(2*self._leaves)
+        if num_blocks:
+            self._add_free(0, num_blocks)
+
+    def is_used(self, block: int) -> bool:
+        return bool(self.bitmap[block >> 3] & (1 << (block & 7)))
+
+    def _mark(self, start: int, length: int, used: bool) -> None:
+        end = start+length
+        # Bit by bit up to a byte boundary, whole bytes in the middle, bits again at the end
+        head_end = min(end, -(-start//8)*8)
+        tail_start = max(head_end, end//8*8)
+        for block in (*range(start, head_end), *range(tail_start, end)):
+            if used:
+                self.bitmap[block >> 3] |= 1 << (block & 7)
+            else:
+                self.bitmap[block >> 3] &= ~(1 << (block & 7))
+        full = tail_start//8-head_end//8
+        if full > 0:
+            self.bitmap[head_end//8:tail_start//8] = (b"\xff" if used else b"\x00")*full
+
+    def _set_length(self, length: int, present: bool) -> None:
+        tree = self._tree
+        i = self._leaves+length
+        tree[i] = present
+        while i > 1:
+            i >>= 1
+            value = tree[2*i] | tree[2*i+1]
+            if tree[i] == value:
+                break
+            tree[i] = value
+
+    def _fit(self, n: int) -> int:
+        """Smallest free extent length >= n, or 0 if none is that long."""
+        if n in self._by_length:
+            return n
+        tree = self._tree
+        i = self._leaves+n
+        if not tree[i]:
+            # Up until there's a nonempty subtree to the right, then down its left edge
+            while i > 1 and (i & 1 or not tree[i+1]):
+                i >>= 1
+            if i == 1:
+                return 0
+            i += 1
+            while i < self._leaves:
+                i = 2*i if tree[2*i] else 2*i+1
+        return i-self._leaves
+
+    def _longest(self) -> int:
+        tree = self._tree
+        i = 1
+        while i < self._leaves:
+            i = 2*i+1 if tree[2*i+1] else 2*i
+        return i-self._leaves
+
+    def _add_free(self, start: int, length: int) -> None:
+        self._lengths[start] = length
+        self._ends[start+length] = start
+        starts = self._by_length.get(length)
+        if starts is None:
+            starts = self._by_length[length] = set()
+            self._set_length(length, True)
+        starts.add(start)
+
+    def _remove_free(self, start: int) -> int:
+        length = self._lengths.pop(start)
+        del self._ends[start+length]
+        starts = self._by_length[length]
+        starts.remove(start)
+        if not starts:
+            del self._by_length[length]
+            self._set_length(length, False)
+        return length
+
+    def _take(self, start: int, n: int) -> None:
+        # Take the first n blocks of the free extent at start
+        length = self._remove_free(start)
+        if length > n:
+            self._add_free(start+n, length-n)
+        self._mark(start, n, True)
+        self.free_blocks -= n
+
+    def allocate(self, n: int) -> List[Tuple[int, int]]:
+        """Allocate n blocks as few (start, length) extents as possible."""
+        if n > self.free_blocks:
+            raise ValueError("No space left for data")
+        extents = []
+        while n:
+            length = self._fit(n)
+            if length:
+                # Smallest free extent that fits the rest
+                take = n
+            else:
+                # Nothing fits: use the largest and keep going
+                length = take = self._longest()
+            # Any extent of that length will do
+            starts = self._by_length[length]
+            start = starts.pop()
+            starts.add(start)
+            self._take(start, take)
+            extents.append((start, take))
+            n -= take
+        return extents
+
+    def extend(self, start: int, length: int, n: int) -> int:
+        """Grow the extent (start, length) in place by up to n blocks; return how many."""
+        end = start+length
+        if end not in self._lengths:
+            return 0
+        take = min(n, self._lengths[end])
+        self._take(end, take)
+        return take
+
+    def free(self, start: int, length: int) -> None:
+        self._mark(start, length, False)
+        self.free_blocks += length
+        # Merge with the free extents right before and right after
+        if start+length in self._lengths:
+            length += self._remove_free(start+length)
+        prev = self._ends.get(start)
+        if prev is not None:
+            start, length = prev, self._remove_free(prev)+length
+        self._add_free(start, length)
+
+
+class _Inode:
+    def __init__(self):
+        self.extents: List[Tuple[int, int]] = []  # (first block, block count)
+        self.size = 0
+
+    @property
+    def num_blocks(self) -> int:
+        return sum(length for _, length in self.extents)
+
+
+class File:
+    """Handle to one file in a FileTable."""
+    def __init__(self, table: "FileTable", inode: _Inode):
+        self._table = table
+        self._inode = inode
+
+    @property
+    def size(self) -> int:
+        return self._inode.size
+
+    @property
+    def extents(self) -> List[Tuple[int, int]]:
+        return list(self._inode.extents)
+
+    def _ranges(self, pos: int, n: int):
+        # Map a byte range of the file to byte ranges of the Filesystem
+        logical = 0
+        for start, length in self._inode.extents:
+            extent_bytes = length*BLOCK_SIZE
+            if pos < logical+extent_bytes and n > 0:
+                offset = pos-logical
+                take = min(n, extent_bytes-offset)
+                yield start*BLOCK_SIZE+offset, take
+                pos += take
+                n -= take
+            logical += extent_bytes
+
+    def read(self, pos: int, n: int) -> bytes:
+        if pos < 0 or n < 0 or pos+n > self._inode.size:
+            raise ValueError("Read data larger than file size")
+        fs = self._table.fs
+        return b"".join(fs.read(at, take) for at, take in self._ranges(pos, n))
+
+    def write(self, pos: int, data: Union[str, bytes]) -> None:
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        if pos < 0:
+            raise ValueError("Write position must not be negative")
+        if pos > self._inode.size:
+            # Fill the gap so it never exposes stale blocks
+            data = bytes(pos-self._inode.size)+data
+            pos = self._inode.size
+        end = pos+len(data)
+        self._table._reserve(self._inode, -(-end//BLOCK_SIZE))
+        fs = self._table.fs
+        done = 0
+        for at, take in self._ranges(pos, len(data)):
+            fs.write(at, data[done:done+take])
+            done += take
+        self._inode.size = max(self._inode.size, end)
+
+    def append(self, data: Union[str, bytes]) -> None:
+        self.write(self._inode.size, data)
+
+    def truncate(self, size: int) -> None:
+        if size < 0:
+            raise ValueError("File size must not be negative")
+        if size > self._inode.size:
+            self.write(self._inode.size, bytes(size-self._inode.size))
+            return
+        self._inode.size = size
+        self._table._release(self._inode, -(-size//BLOCK_SIZE))
+
+
+class FileTable:
+    """Named files on top of a Filesystem's blocks.
+
+    Each file is a list of extents handed out by an ExtentAllocator. Growing
+    a file first tries to extend its last extent in place, then takes a new
+    best-fit extent. Each growth also reserves up to `preallocate` blocks
+    past the end (as many as the file already has, so the window doubles),
+    so files appended to in turn don't split each other into one extent
+    per append. Reserved blocks are given back by truncate() and delete(),
+    and taken back from every file when a write would otherwise run out of
+    space.
+
+    The table lives only in memory: it starts with every block free and
+    nothing is written to the image. Use it on a fresh Filesystem, not on
+    an image holding data from an earlier run, as that data would be
+    allocated over and its files are not found again on reopen.
+    """
+    # Most blocks reserved past the end of a growing file
+    preallocate = 1024
+
+    def __init__(self, fs: Filesystem):
+        self.fs = fs
+        self.allocator = ExtentAllocator(fs.num_blocks)
+        self._files: Dict[str, _Inode] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._files
+
+    def list(self) -> List[str]:
+        return sorted(self._files)
+
+    def create(self, name: str) -> File:
+        if name in self._files:
+            raise ValueError(f"File {name!r} already exists")
+        self._files[name] = _Inode()
+        return File(self, self._files[name])
+
+    def open(self, name: str) -> File:
+        if name not in self._files:
+            raise KeyError(name)
+        return File(self, self._files[name])
+
+    def delete(self, name: str) -> None:
+        inode = self._files.pop(name)
+        self._release(inode, 0)
+
+    def _reserve(self, inode: _Inode, num_blocks: int) -> None:
+        need = num_blocks-inode.num_blocks
+        if need <= 0:
+            return
+        if need > self.allocator.free_blocks:
+            # Take back what other files reserved ahead of their data
+            for other in self._files.values():
+                self._release(other, -(-other.size//BLOCK_SIZE))
+            need = num_blocks-inode.num_blocks
+            if need > self.allocator.free_blocks:
+                raise ValueError("No space left for data")
+        need = min(need+min(num_blocks, self.preallocate), self.allocator.free_blocks)
+        if inode.extents:
+            start, length = inode.extents[-1]
+            grown = self.allocator.extend(start, length, need)
+            inode.extents[-1] = (start, length+grown)
+            need -= grown
+        if need:
+            for start, length in self.allocator.allocate(need):
+                last_start, last_length = inode.extents[-1] if inode.extents else (None, 0)
+                if last_start is not None and last_start+last_length == start:
+                    inode.extents[-1] = (last_start, last_length+length)
+                else:
+                    inode.extents.append((start, length))
+
+    def _release(self, inode: _Inode, num_blocks: int) -> None:
+        # Free everything past the first num_blocks blocks of the file
+        extra = inode.num_blocks-num_blocks
+        while extra > 0:
+            start, length = inode.extents.pop()
+            drop = min(extra, length)
+            self.allocator.free(start+length-drop, drop)
+            if drop < length:
+                inode.extents.append((start, length-drop))
+            extra -= drop
+
+
+if __name__ == "__main__":
+    fs = Filesystem([
+            Node("abcdefgh"), 
+            Node("ijklmnop")
+        ])
+
+
+    fs.print()
+    fs.write(8,"12345678")
+    fs.print()
+    print(fs.read(8,8).tobytes().decode())
+    # print(fs.read(8,16))
+    # fs.write(8,"1234567812345678")
 
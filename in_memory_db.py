@@ -1,11 +1,90 @@
+import bisect
+import gc
+import heapq
+import os
+import pickle
+import struct
+import threading
+import zlib
 from collections import defaultdict
-from typing import Optional, List
+from itertools import islice
+from typing import Iterator, Optional, List, Tuple
+
+# Append-only file record: payload length, crc32 of payload. The payload is
+# a pickled (key, field, (val, expire) or None) giving the field's new state.
+AOF_RECORD = struct.Struct("<II")
+# Starts a binary snapshot, on its own or as the base of a rewritten AOF
+SNAPSHOT_MAGIC = b"IMDBSNP1"
+FSYNC_POLICIES = ("always", "interval", "never")
 
 
 class InMemoryDB:
-    def __init__(self):
+    # Expiry heap entries examined by every operation, so expired fields are
+    # evicted a few at a time without a background thread
+    REAP_PER_OP = 16
+
+    def __init__(
+        self,
+        aof_path: Optional[str] = None,
+        fsync: str = "interval",
+        fsync_ms: int = 1000,
+        rewrite_min_bytes: int = 64 * 1024 * 1024,
+        rewrite_growth: Optional[float] = 1.0,
+    ):
+        """With aof_path, every committed change is appended to that file and
+        replayed from it on startup.
+
+        Every change is written through to the OS before it returns, so a
+        crashed process loses nothing. fsync decides what survives a crash of
+        the machine: "always" fsyncs before each write or commit returns,
+        "interval" has a background thread fsync every fsync_ms, and "never"
+        leaves it to the OS. Once the file has grown by rewrite_growth
+        times its size after the last rewrite, and is at least
+        rewrite_min_bytes, it is rewritten in the background; set
+        rewrite_growth to None to only rewrite on rewrite_aof().
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        if fsync == "interval" and fsync_ms <= 0:
+            raise ValueError(f"fsync_ms must be positive, got {fsync_ms}")
         self.db = defaultdict(dict)
         self.tx_stack = []
+        # (expire time, key, field) for every field set with a TTL. Entries
+        # whose field was since overwritten or deleted are stale and skipped
+        # when popped; the heap is rebuilt when they make up most of it.
+        self._expiry = []
+        self._stale_expiries = 0
+        # Fields of a key in sorted order, built the first time the key is
+        # scanned and kept up to date from then on
+        self._index = {}  # {key: [field, ...]}
+
+        self.aof_path = aof_path
+        self.fsync = fsync
+        self.fsync_ms = fsync_ms
+        self.rewrite_min_bytes = rewrite_min_bytes
+        self.rewrite_growth = rewrite_growth
+        self._aof = None
+        # Guards the file descriptor between writes, the fsync thread and
+        # swapping in a rewritten file
+        self._aof_lock = threading.Lock()
+        self._unsynced = False
+        self._closed = threading.Event()
+        self._fsync_thread = None
+        self._aof_bytes = 0
+        self._aof_base_bytes = 0
+        # Child process writing a rewritten AOF, and the records logged
+        # since it forked, which go on the end of its file
+        self._rewrite_pid = None
+        self._rewrite_buffer = bytearray()
+        self.rewrites = 0
+        if aof_path is not None:
+            if os.path.exists(aof_path):
+                self._load_aof()
+            self._aof = open(aof_path, "ab")
+            self._aof_bytes = self._aof_base_bytes = self._aof.tell()
+            if fsync == "interval":
+                self._fsync_thread = threading.Thread(target=self._fsync_loop, daemon=True)
+                self._fsync_thread.start()
 
     def _is_alive(self, t, expire_time):
         return expire_time is None or t < expire_time
@@ -15,7 +94,76 @@ class InMemoryDB:
             return
         current_tx = self.tx_stack[-1]
         if (key, field) not in current_tx:
-            current_tx[(key, field)] = self.db[key].get(field, None)
+            current_tx[(key, field)] = self.db.get(key, {}).get(field, None)
+
+    def _put_field(self, key, field, entry):
+        """Store (val, expire) for a field, or remove it if entry is None."""
+        self._apply_field(key, field, entry)
+        # Logged after applying, so a rewrite started from here includes it
+        if self._aof is not None and not self.tx_stack:
+            self._log(key, field, entry)
+            self._after_log()
+
+    def _apply_field(self, key, field, entry):
+        fields = self.db[key]
+        old = fields.get(field)
+        if old is not None and old[1] is not None:
+            self._stale_expiries += 1
+        if entry is None:
+            if old is not None:
+                self._remove_field(key, fields, field)
+            elif not fields:
+                del self.db[key]
+            return
+        fields[field] = entry
+        if old is None and key in self._index:
+            bisect.insort(self._index[key], field)
+        if entry[1] is not None:
+            heapq.heappush(self._expiry, (entry[1], key, field))
+        if self._stale_expiries > 64 and self._stale_expiries * 2 > len(self._expiry):
+            self._rebuild_expiry()
+
+    def _remove_field(self, key, fields, field):
+        del fields[field]
+        index = self._index.get(key)
+        if not fields:
+            del self.db[key]
+            self._index.pop(key, None)
+        elif index is not None:
+            del index[bisect.bisect_left(index, field)]
+
+    def _rebuild_expiry(self):
+        live = set()
+        for expire, key, field in self._expiry:
+            entry = self.db.get(key, {}).get(field)
+            if entry is not None and entry[1] == expire:
+                live.add((expire, key, field))
+        self._expiry = list(live)
+        heapq.heapify(self._expiry)
+        self._stale_expiries = 0
+
+    def advance(self, t: int, limit: Optional[int] = None) -> int:
+        """Evict fields that have expired by time t; returns how many were evicted.
+
+        At most limit heap entries are examined, so a caller can spread the
+        work out. Times passed to the db must not go backwards, since an
+        evicted field is gone even for an earlier t.
+        """
+        heap = self._expiry
+        evicted = 0
+        examined = 0
+        while heap and heap[0][0] <= t and (limit is None or examined < limit):
+            expire, key, field = heapq.heappop(heap)
+            examined += 1
+            fields = self.db.get(key)
+            entry = fields.get(field) if fields is not None else None
+            if entry is None or entry[1] != expire:
+                # Overwritten or deleted since this entry was pushed
+                self._stale_expiries = max(self._stale_expiries - 1, 0)
+                continue
+            self._remove_field(key, fields, field)
+            evicted += 1
+        return evicted
 
     def begin(self):
         self.tx_stack.append({})
@@ -25,10 +173,9 @@ class InMemoryDB:
             raise RuntimeError("NO TRANSACTION")
         tx = self.tx_stack.pop()
         for (key, field), old_val in tx.items():
-            if old_val is None:
-                self.db[key].pop(field, None)
-            else:
-                self.db[key][field] = old_val
+            # Puts a restored TTL back in the heap. Nothing to log: the AOF
+            # never saw the rolled back changes.
+            self._apply_field(key, field, old_val)
 
     def commit(self):
         if not self.tx_stack:
@@ -39,17 +186,25 @@ class InMemoryDB:
                 if k not in final_tx:
                     final_tx[k] = v
         self.tx_stack = []
+        if self._aof is not None and final_tx:
+            # The whole transaction reaches the log together
+            for key, field in final_tx:
+                self._log(key, field, self.db.get(key, {}).get(field))
+            self._after_log()
 
     def set(self, t: int, key: str, field: str, val: int):
+        self.advance(t, self.REAP_PER_OP)
         self._record_change(key, field)
-        self.db[key][field] = (val, None)
+        self._put_field(key, field, (val, None))
 
     def set_with_ttl(self, t: int, key: str, field: str, val: int, ttl: int):
+        self.advance(t, self.REAP_PER_OP)
         self._record_change(key, field)
         expire = t + ttl
-        self.db[key][field] = (val, expire)
+        self._put_field(key, field, (val, expire))
 
     def get(self, t: int, key: str, field: str) -> Optional[int]:
+        self.advance(t, self.REAP_PER_OP)
         if key in self.db and field in self.db[key]:
             val, exp = self.db[key][field]
             if self._is_alive(t, exp):
@@ -61,7 +216,7 @@ class InMemoryDB:
     ) -> bool:
         if self.get(t, key, field) == expected_val:
             self._record_change(key, field)
-            self.db[key][field] = (new_val, None)
+            self._put_field(key, field, (new_val, None))
             return True
         return False
 
@@ -70,82 +225,360 @@ class InMemoryDB:
     ) -> bool:
         if self.get(t, key, field) == expected_val:
             self._record_change(key, field)
-            self.db[key][field] = (new_val, t + ttl)
+            self._put_field(key, field, (new_val, t + ttl))
             return True
         return False
 
     def compare_and_del(self, t: int, key: str, field: str, expected_val: int) -> bool:
         if self.get(t, key, field) == expected_val:
             self._record_change(key, field)
-            del self.db[key][field]
+            self._put_field(key, field, None)
             return True
         return False
 
-    def scan(self, t: int, key: str) -> List[str]:
-        if key not in self.db:
-            return []
-        result = []
-        for field, (val, exp) in self.db[key].items():
+    def iter_scan(
+        self, t: int, key: str, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[Tuple[str, int]]:
+        """Lazily yield (field, val) for live fields starting with prefix, in field order.
+
+        With start_after, resume after that field. Finding the first field is
+        a bisect, so taking k results costs O(log n + k). Other calls may run
+        while iterating: if the index has shifted since the last field, the
+        next one is found again by bisecting past it.
+        """
+        self.advance(t, self.REAP_PER_OP)
+        last = start_after
+        i = None
+        while True:
+            fields = self.db.get(key)
+            if fields is None:
+                return
+            index = self._index.get(key)
+            if index is None:
+                index = self._index[key] = sorted(fields)
+            # Fields are unique, so if last still sits just before i, i is
+            # right; otherwise fields were added or removed meanwhile
+            if i is None or not (0 < i <= len(index) and index[i - 1] == last):
+                i = bisect.bisect_left(index, prefix)
+                if last is not None:
+                    i = max(i, bisect.bisect_right(index, last))
+            if i >= len(index):
+                return
+            field = index[i]
+            if not field.startswith(prefix):
+                return
+            i += 1
+            last = field
+            val, exp = fields[field]
             if self._is_alive(t, exp):
-                result.append(f"{field}({val})")
-        return sorted(result)
+                yield field, val
+
+    def scan_page(
+        self, t: int, key: str, prefix: str = "", limit: int = 100, cursor: Optional[str] = None
+    ) -> Tuple[List[str], Optional[str]]:
+        """One page of scan_by_prefix results and the cursor for the next (None at the end)."""
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        page = list(islice(self.iter_scan(t, key, prefix, cursor), limit + 1))
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        return [f"{field}({val})" for field, val in page[:limit]], next_cursor
+
+    def _log(self, key, field, entry):
+        payload = pickle.dumps((key, field, entry), pickle.HIGHEST_PROTOCOL)
+        record = AOF_RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+        self._aof.write(record)
+        self._aof_bytes += len(record)
+        if self._rewrite_pid is not None:
+            self._rewrite_buffer += record
+
+    def _after_log(self):
+        if self.fsync == "always":
+            self.flush()
+        else:
+            # Into the OS page cache, so the change survives the process
+            self._aof.flush()
+            self._unsynced = True
+        if self._rewrite_pid is not None:
+            pid, status = os.waitpid(self._rewrite_pid, os.WNOHANG)
+            if pid:
+                self._finish_rewrite(status)
+        elif (
+            self.rewrite_growth is not None
+            and self._aof_bytes >= self.rewrite_min_bytes
+            and self._aof_bytes >= self._aof_base_bytes * (1 + self.rewrite_growth)
+        ):
+            self.rewrite_aof()
+
+    def flush(self):
+        """Write out and fsync everything logged so far."""
+        with self._aof_lock:
+            if self._aof is not None:
+                self._aof.flush()
+                self._unsynced = False
+                os.fsync(self._aof.fileno())
+
+    def _fsync_loop(self):
+        while not self._closed.wait(self.fsync_ms / 1000):
+            with self._aof_lock:
+                if self._unsynced and self._aof is not None:
+                    # Cleared first, so a write landing during the fsync
+                    # is picked up next time round
+                    self._unsynced = False
+                    os.fsync(self._aof.fileno())
+
+    def _load_aof(self):
+        with open(self.aof_path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                self._read_snapshot(f)
+            else:
+                f.seek(0)
+            data = f.read()
+            base = f.tell() - len(data)
+        pos = 0
+        while pos + AOF_RECORD.size <= len(data):
+            length, crc = AOF_RECORD.unpack_from(data, pos)
+            payload = data[pos + AOF_RECORD.size:pos + AOF_RECORD.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            pos += AOF_RECORD.size + length
+            key, field, entry = pickle.loads(payload)
+            self._apply_field(key, field, entry)
+        if pos < len(data):
+            # Torn write from a crash; drop it so new records follow valid ones
+            with open(self.aof_path, "r+b") as f:
+                f.truncate(base + pos)
+                os.fsync(f.fileno())
+
+    def _committed(self):
+        """The data as of the last commit, without open transactions' changes."""
+        if not self.tx_stack:
+            return self.db
+        db = dict(self.db)
+        for tx in reversed(self.tx_stack):
+            for (key, field), old_val in tx.items():
+                fields = db[key] = dict(db.get(key, {}))
+                if old_val is None:
+                    fields.pop(field, None)
+                else:
+                    fields[field] = old_val
+        return {key: fields for key, fields in db.items() if fields}
+
+    def _write_snapshot(self, f):
+        db = self._committed()
+        expiry = set()
+        for expire, key, field in self._expiry:
+            entry = db.get(key, {}).get(field)
+            if entry is not None and entry[1] == expire:
+                expiry.add((expire, key, field))
+        # Fields a transaction overwrote may have lost their heap entry
+        for tx in self.tx_stack:
+            for (key, field), old_val in tx.items():
+                if old_val is not None and old_val[1] is not None:
+                    expiry.add((old_val[1], key, field))
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump({"db": db, "expiry": list(expiry)}, f, pickle.HIGHEST_PROTOCOL)
+
+    def _read_snapshot(self, f):
+        # Millions of new tuples would trigger the cyclic GC over and over,
+        # and none of them can be garbage yet
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load_snapshot(pickle.load(f))
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _load_snapshot(self, state):
+        self.db = defaultdict(dict, state["db"])
+        self._expiry = state["expiry"]
+        heapq.heapify(self._expiry)
+        self._stale_expiries = 0
+        self._index = {}
+
+    def save_snapshot(self, path: str):
+        """Write the committed data to a binary snapshot file."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            self._write_snapshot(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def restore_snapshot(self, path: str):
+        """Replace all data with a snapshot written by save_snapshot."""
+        if self.tx_stack:
+            raise RuntimeError("TRANSACTION IN PROGRESS")
+        with open(path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not an InMemoryDB snapshot")
+            self._read_snapshot(f)
+        if self._aof is not None:
+            # The log no longer describes the data; start it from the snapshot
+            self.wait_rewrite()
+            self.rewrite_aof()
+            self.wait_rewrite()
+
+    def rewrite_aof(self):
+        """Compact the AOF in the background: a snapshot of the current data
+        plus whatever is logged while it is written.
+
+        A forked child writes the snapshot from its copy-on-write view of
+        memory; the new file replaces the old once the child is done and the
+        records logged meanwhile are appended. Does nothing if a rewrite is
+        already running.
+        """
+        if self._aof is None:
+            raise RuntimeError("NO AOF")
+        if self._rewrite_pid is not None:
+            return
+        tmp = self.aof_path + ".rewrite"
+        self._aof.flush()
+        if not hasattr(os, "fork"):
+            self._write_rewrite(tmp)
+            self._rewrite_buffer.clear()
+            self._swap_aof(tmp)
+            return
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self._write_rewrite(tmp)
+            finally:
+                os._exit(0 if os.path.exists(tmp) else 1)
+        self._rewrite_pid = pid
+
+    def _write_rewrite(self, tmp):
+        try:
+            with open(tmp, "wb") as f:
+                self._write_snapshot(f)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def wait_rewrite(self):
+        """Block until a running background rewrite has been swapped in."""
+        if self._rewrite_pid is not None:
+            _, status = os.waitpid(self._rewrite_pid, 0)
+            self._finish_rewrite(status)
+
+    def _finish_rewrite(self, status):
+        self._rewrite_pid = None
+        tmp = self.aof_path + ".rewrite"
+        if os.waitstatus_to_exitcode(status) != 0:
+            # Keep the old file, which has every record; try again later
+            self._rewrite_buffer.clear()
+            self._aof_base_bytes = self._aof_bytes
+            return
+        with open(tmp, "ab") as f:
+            f.write(self._rewrite_buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        self._rewrite_buffer.clear()
+        self._swap_aof(tmp)
+
+    def _swap_aof(self, tmp):
+        os.replace(tmp, self.aof_path)
+        fd = os.open(os.path.dirname(os.path.abspath(self.aof_path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._aof_lock:
+            self._aof.close()
+            self._aof = open(self.aof_path, "ab")
+            # The rewritten file was fsynced before the swap
+            self._unsynced = False
+        self._aof_bytes = self._aof_base_bytes = self._aof.tell()
+        self.rewrites += 1
+
+    def close(self):
+        if self._aof is not None:
+            self.wait_rewrite()
+            self._closed.set()
+            if self._fsync_thread is not None:
+                self._fsync_thread.join()
+            self.flush()
+            with self._aof_lock:
+                self._aof.close()
+                self._aof = None
+
+    def scan(self, t: int, key: str) -> List[str]:
+        return [f"{field}({val})" for field, val in self.iter_scan(t, key)]
 
     def scan_by_prefix(self, t: int, key: str, prefix: str) -> List[str]:
-        if key not in self.db:
-            return []
-        result = []
-        for field, (val, exp) in self.db[key].items():
-            if field.startswith(prefix) and self._is_alive(t, exp):
-                result.append(f"{field}({val})")
-        return sorted(result)
-
-
-# test case 1
-db = InMemoryDB()
-
-db.set(1, "user", "name", "Alice")
-print(db.get(1, "user", "name"))  # Alice
-
-db.compare_and_set(2, "user", "name", "Alice", "Bob")
-print(db.get(2, "user", "name"))  # Bob
-
-db.compare_and_del(3, "user", "name", "Bob")
-print(db.get(3, "user", "name"))  # None
-
-# test case 2
-db = InMemoryDB()
-db.set(1, "user", "name", "Alice")
-db.set(2, "user", "email", "alice@example.com")
-db.set(3, "user", "nickname", "Ally")
-
-print(db.scan(2, "user"))
-# Output: [['name', 'Alice'], ['email', 'alice@example.com']]
-
-print(db.scan_by_prefix(3, "user", "n"))
-# Output: [['name', 'Alice'], ['nickname', 'Ally']]
-
-# test case 3
-db = InMemoryDB()
-
-db.set(1, "A", "B", 4)
-db.set_with_ttl(2, "X", "Y", 5, 15)
-db.set_with_ttl(4, "A", "D", 3, 6)
-
-print(db.compare_and_set_with_ttl(6, "A", "D", 3, 5, 10))  # True
-print(db.get(7, "A", "D"))  # 5
-print(db.scan(15, "A"))  # ['B(4)', 'D(5)']
-print(db.scan(17, "A"))  # ['B(4)']
-
-# test case 4
-db = InMemoryDB()
-db.set(1, "user", "age", 25)
-db.begin()
-db.set(2, "user", "age", 30)
-print(db.get(3, "user", "age"))  # 30
-db.rollback()
-print(db.get(4, "user", "age"))  # 25
-
-db.begin()
-db.set(5, "user", "age", 35)
-db.commit()
-print(db.get(6, "user", "age"))  # 35
+        return [f"{field}({val})" for field, val in self.iter_scan(t, key, prefix)]
+
+
+if __name__ == "__main__":
+    # test case 1
+    db = InMemoryDB()
+
+    db.set(1, "user", "name", "Alice")
+    print(db.get(1, "user", "name"))  # Alice
+
+    db.compare_and_set(2, "user", "name", "Alice", "Bob")
+    print(db.get(2, "user", "name"))  # Bob
+
+    db.compare_and_del(3, "user", "name", "Bob")
+    print(db.get(3, "user", "name"))  # None
+
+    # test case 2
+    db = InMemoryDB()
+    db.set(1, "user", "name", "Alice")
+    db.set(2, "user", "email", "alice@example.com")
+    db.set(3, "user", "nickname", "Ally")
+
+    print(db.scan(2, "user"))
+    # Output: [['name', 'Alice'], ['email', 'alice@example.com']]
+
+    print(db.scan_by_prefix(3, "user", "n"))
+    # Output: [['name', 'Alice'], ['nickname', 'Ally']]
+
+    # test case 3
+    db = InMemoryDB()
+
+    db.set(1, "A", "B", 4)
+    db.set_with_ttl(2, "X", "Y", 5, 15)
+    db.set_with_ttl(4, "A", "D", 3, 6)
+
+    print(db.compare_and_set_with_ttl(6, "A", "D", 3, 5, 10))  # True
+    print(db.get(7, "A", "D"))  # 5
+    print(db.scan(15, "A"))  # ['B(4)', 'D(5)']
+    print(db.scan(17, "A"))  # ['B(4)']
+
+    # test case 4
+    db = InMemoryDB()
+    db.set(1, "user", "age", 25)
+    db.begin()
+    db.set(2, "user", "age", 30)
+    print(db.get(3, "user", "age"))  # 30
+    db.rollback()
+    print(db.get(4, "user", "age"))  # 25
+
+    db.begin()
+    db.set(5, "user", "age", 35)
+    db.commit()
+    print(db.get(6, "user", "age"))  # 35
+
+    # test case 5
+    db = InMemoryDB()
+    for i in range(1000):
+        db.set_with_ttl(1, "session", f"s{i}", i, 10)
+    db.set(1, "session", "admin", 0)
+    db.compare_and_set_with_ttl(5, "session", "s0", 0, 0, 100)
+    print(db.advance(11))  # 999
+    print(db.scan(12, "session"))  # ['admin(0)', 's0(0)']
+
+    # test case 6
+    db = InMemoryDB()
+    for i in range(10):
+        db.set(1, "user", f"tag{i}", i)
+    db.set(1, "user", "name", "Alice")
+    page, cursor = db.scan_page(2, "user", "tag", limit=4)
+    print(page, cursor)  # ['tag0(0)', 'tag1(1)', 'tag2(2)', 'tag3(3)'] tag3
+    page, cursor = db.scan_page(2, "user", "tag", limit=4, cursor=cursor)
+    print(page, cursor)  # ['tag4(4)', 'tag5(5)', 'tag6(6)', 'tag7(7)'] tag7
+    print(db.scan_page(2, "user", "tag", limit=4, cursor=cursor))  # (['tag8(8)', 'tag9(9)'], None)
@@ -0,0 +1,83 @@
+"""
+Restore throughput of InMemoryDB persistence.
+
+Builds a --fields dataset (--fields-per-key fields per key, a tenth with a
+TTL), saves a binary snapshot and times restoring it. Then logs
+--aof-fields changes to an AOF under each fsync policy and times replaying
+the log on startup.
+
+python in_memory_db_bench.py --fields 10000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from in_memory_db import FSYNC_POLICIES, InMemoryDB
+
+
+def fill(db, fields, fields_per_key):
+    for i in range(fields):
+        key, field = f"key{i // fields_per_key}", f"field{i % fields_per_key}"
+        if i % 10 == 0:
+            db.set_with_ttl(0, key, field, i, 10 ** 9)
+        else:
+            db.set(0, key, field, i)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=10000000)
+    parser.add_argument("--fields-per-key", type=int, default=1000)
+    parser.add_argument("--aof-fields", type=int, default=1000000)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        db = InMemoryDB()
+        start = time.perf_counter()
+        fill(db, args.fields, args.fields_per_key)
+        print(f"built {args.fields:,} fields in {time.perf_counter() - start:.1f}s")
+
+        path = os.path.join(tmp, "snapshot")
+        start = time.perf_counter()
+        db.save_snapshot(path)
+        save_s = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"snapshot: saved {size_mb:,.0f} MB in {save_s:.1f}s")
+        del db
+
+        restored = InMemoryDB()
+        start = time.perf_counter()
+        restored.restore_snapshot(path)
+        restore_s = time.perf_counter() - start
+        print(
+            f"snapshot: restored in {restore_s:.1f}s"
+            f"  ({args.fields / restore_s:,.0f} fields/s, {size_mb / restore_s:,.0f} MB/s)"
+        )
+        last = args.fields - 1
+        assert restored.get(1, f"key{last // args.fields_per_key}", f"field{last % args.fields_per_key}") == last
+        del restored
+
+        for policy in FSYNC_POLICIES:
+            path = os.path.join(tmp, f"{policy}.aof")
+            # fsync on every write is far slower; keep its run short
+            fields = args.aof_fields if policy != "always" else min(args.aof_fields, 10000)
+            db = InMemoryDB(path, fsync=policy, rewrite_growth=None)
+            start = time.perf_counter()
+            fill(db, fields, args.fields_per_key)
+            db.close()
+            write_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            replayed = InMemoryDB(path)
+            replay_s = time.perf_counter() - start
+            replayed.close()
+            print(
+                f"aof {policy:8}: {fields / write_s:10,.0f} writes/s,"
+                f" replayed {fields:,} in {replay_s:.2f}s ({fields / replay_s:,.0f} fields/s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
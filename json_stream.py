@@ -0,0 +1,282 @@
+"""
+Incremental JSON validation against a JSON schema.
+
+Text is fed in pieces as it arrives (e.g. streamed model output). The
+validator raises SchemaMismatch on the first character after which no
+completion of the text could be valid JSON matching the schema, and reports
+when the top-level value has closed.
+
+Checked: JSON syntax, "type" (including lists of types), "properties",
+"additionalProperties": false, "required", "items", and local "$ref"s.
+Anything else (anyOf branches, enum, lengths, ...) is left to the final
+full validation.
+"""
+
+_WHITESPACE = " \t\n\r"
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX = "0123456789abcdefABCDEF"
+_DIGITS = "0123456789"
+
+
+class SchemaMismatch(ValueError):
+    """The text seen so far can no longer become a document matching the schema."""
+
+
+class _Frame:
+    def __init__(self, kind, schema, state):
+        self.kind = kind
+        self.schema = schema
+        self.state = state
+        # object: keys seen and the key being read; string: collected chars
+        # for object keys; literal: the characters still expected
+        self.seen = set()
+        self.key = None
+        self.chars = None
+        self.hex = ""
+
+
+class IncrementalValidator:
+    def __init__(self, schema):
+        self._root = schema
+        self._stack = []
+        self._started = False
+        self.done = False
+
+    def feed(self, text):
+        """Consume text up to the end of the top-level value.
+
+        Returns how many characters were consumed, which is less than
+        len(text) only if the value closed partway through it.
+        """
+        for i, ch in enumerate(text):
+            if self.done:
+                return i
+            self._step(ch)
+        return len(text)
+
+    def finish(self):
+        """Signal end of input; raises SchemaMismatch if the value never completed."""
+        if self._stack and self._stack[-1].kind == "number" and len(self._stack) == 1:
+            self._end_number(self._stack[-1])
+        if not self.done:
+            raise SchemaMismatch("input ended before the JSON value was complete")
+
+    def _fail(self, message):
+        raise SchemaMismatch(message)
+
+    def _resolve(self, schema):
+        # Follow local references like "#/$defs/Model"
+        while isinstance(schema, dict) and "$ref" in schema:
+            ref = schema["$ref"]
+            if not ref.startswith("#/"):
+                return {}
+            target = self._root
+            for part in ref[2:].split("/"):
+                target = target.get(part, {})
+            schema = target
+        return schema if isinstance(schema, dict) else {}
+
+    def _allowed_types(self, schema):
+        types = schema.get("type")
+        if types is None:
+            return None
+        types = {types} if isinstance(types, str) else set(types)
+        if "integer" in types:
+            # Integers and floats share a syntax; leave the distinction to
+            # the final validation rather than abort on "1.0"
+            types.add("number")
+        return types
+
+    def _step(self, ch):
+        if not self._stack:
+            if ch in _WHITESPACE:
+                return
+            if self._started:
+                self._fail(f"unexpected {ch!r} after the JSON value")
+            self._started = True
+            self._start_value(ch, self._root)
+            return
+
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            self._step_object(frame, ch)
+        elif frame.kind == "array":
+            self._step_array(frame, ch)
+        elif frame.kind == "string":
+            self._step_string(frame, ch)
+        elif frame.kind == "number":
+            self._step_number(frame, ch)
+        else:
+            self._step_literal(frame, ch)
+
+    def _start_value(self, ch, schema):
+        schema = self._resolve(schema)
+        if ch == "{":
+            kind, frame = "object", _Frame("object", schema, "first")
+        elif ch == "[":
+            kind, frame = "array", _Frame("array", schema, "first")
+        elif ch == '"':
+            kind, frame = "string", _Frame("string", schema, "chars")
+        elif ch == "-" or ch in _DIGITS:
+            kind = "number"
+            frame = _Frame("number", schema, "sign" if ch == "-" else "zero" if ch == "0" else "int")
+        elif ch in "tf":
+            kind, frame = "boolean", _Frame("literal", schema, None)
+            frame.chars = list("true"[1:] if ch == "t" else "false"[1:])
+        elif ch == "n":
+            kind, frame = "null", _Frame("literal", schema, None)
+            frame.chars = list("ull")
+        else:
+            self._fail(f"unexpected {ch!r} where a value should start")
+
+        allowed = self._allowed_types(schema)
+        if allowed is not None and kind not in allowed:
+            self._fail(f"got {kind}, schema expects {' or '.join(sorted(allowed))}")
+        self._stack.append(frame)
+
+    def _end_value(self):
+        self._stack.pop()
+        if not self._stack:
+            self.done = True
+            return
+        parent = self._stack[-1]
+        parent.state = "after"
+
+    def _property_schema(self, frame, key):
+        properties = frame.schema.get("properties", {})
+        if key in properties:
+            return properties[key]
+        extra = frame.schema.get("additionalProperties", True)
+        if extra is False:
+            self._fail(f"unexpected property {key!r}")
+        return extra if isinstance(extra, dict) else {}
+
+    def _check_key_prefix(self, frame, prefix):
+        # With additionalProperties: false, a key must stay a prefix of a known name
+        if frame.schema.get("additionalProperties", True) is not False:
+            return
+        if not any(name.startswith(prefix) for name in frame.schema.get("properties", {})):
+            self._fail(f"no property name starts with {prefix!r}")
+
+    def _close_object(self, frame):
+        missing = [name for name in frame.schema.get("required", []) if name not in frame.seen]
+        if missing:
+            self._fail(f"missing required properties {missing}")
+        self._end_value()
+
+    def _step_object(self, frame, ch):
+        if ch in _WHITESPACE:
+            return
+        state = frame.state
+        if state in ("first", "key") and ch == '"':
+            key_frame = _Frame("string", {}, "chars")
+            key_frame.chars = []
+            self._stack.append(key_frame)
+            frame.state = "in_key"
+        elif state == "first" and ch == "}":
+            self._close_object(frame)
+        elif state == "colon" and ch == ":":
+            frame.state = "value"
+        elif state == "value":
+            frame.seen.add(frame.key)
+            self._start_value(ch, self._property_schema(frame, frame.key))
+        elif state == "after" and ch == ",":
+            frame.state = "key"
+        elif state == "after" and ch == "}":
+            self._close_object(frame)
+        else:
+            self._fail(f"unexpected {ch!r} in object")
+
+    def _step_array(self, frame, ch):
+        if ch in _WHITESPACE:
+            return
+        if frame.state == "first" and ch == "]" or frame.state == "after" and ch == "]":
+            self._end_value()
+        elif frame.state == "after" and ch == ",":
+            frame.state = "value"
+        elif frame.state in ("first", "value"):
+            items = frame.schema.get("items", {})
+            self._start_value(ch, items if isinstance(items, dict) else {})
+        else:
+            self._fail(f"unexpected {ch!r} in array")
+
+    def _key_char(self, frame, ch):
+        # Only object keys collect their characters
+        if frame.chars is None:
+            return
+        frame.chars.append(ch)
+        self._check_key_prefix(self._stack[-2], "".join(frame.chars))
+
+    def _step_string(self, frame, ch):
+        if frame.state == "chars":
+            if ch == '"':
+                if frame.chars is not None:
+                    # Finished an object key: hand it to the object frame
+                    self._stack.pop()
+                    parent = self._stack[-1]
+                    parent.key = "".join(frame.chars)
+                    self._property_schema(parent, parent.key)
+                    parent.state = "colon"
+                else:
+                    self._end_value()
+            elif ch == "\\":
+                frame.state = "escape"
+            elif ord(ch) < 0x20:
+                self._fail("unescaped control character in string")
+            else:
+                self._key_char(frame, ch)
+        elif frame.state == "escape":
+            if ch == "u":
+                frame.state = "unicode"
+                frame.hex = ""
+            elif ch in _ESCAPES:
+                frame.state = "chars"
+                self._key_char(frame, _ESCAPES[ch])
+            else:
+                self._fail(f"invalid escape \\{ch}")
+        else:
+            if ch not in _HEX:
+                self._fail(f"invalid unicode escape digit {ch!r}")
+            frame.hex += ch
+            if len(frame.hex) == 4:
+                frame.state = "chars"
+                self._key_char(frame, chr(int(frame.hex, 16)))
+
+    # Number grammar: -?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?
+    _NUMBER_COMPLETE = ("zero", "int", "frac", "exp_digits")
+
+    def _step_number(self, frame, ch):
+        state = frame.state
+        if ch in _DIGITS:
+            if state == "sign":
+                frame.state = "zero" if ch == "0" else "int"
+            elif state in ("int", "frac", "exp_digits"):
+                pass
+            elif state == "dot":
+                frame.state = "frac"
+            elif state in ("exp", "exp_sign"):
+                frame.state = "exp_digits"
+            else:
+                self._fail("leading zero in number")
+        elif ch == "." and state in ("zero", "int"):
+            frame.state = "dot"
+        elif ch in "eE" and state in ("zero", "int", "frac"):
+            frame.state = "exp"
+        elif ch in "+-" and state == "exp":
+            frame.state = "exp_sign"
+        else:
+            # Any other character ends the number and belongs to the parent
+            self._end_number(frame)
+            self._step(ch)
+
+    def _end_number(self, frame):
+        if frame.state not in self._NUMBER_COMPLETE:
+            self._fail("incomplete number")
+        self._end_value()
+
+    def _step_literal(self, frame, ch):
+        if ch != frame.chars[0]:
+            self._fail(f"unexpected {ch!r} in literal")
+        frame.chars.pop(0)
+        if not frame.chars:
+            self._end_value()
@@ -1,16 +1,19 @@
+import asyncio
 import openai
 import json
+import random
 from pydantic import BaseModel, ValidationError
 
+from chat_metrics import ChatMetrics, RequestTimer
+from json_stream import IncrementalValidator, SchemaMismatch
+
 class CodeResponse(BaseModel):
     code: str
 
 prompt = "Write a Python function that returns the square of a number. Return only a JSON object with a 'code' field containing the function as a string."
 
-client = openai.OpenAI(
-    api_key="EMPTY",
-    base_url="http://localhost:8000/v1",
-)
+BASE_URL = "http://localhost:8000/v1"
+MODEL = "Qwen/Qwen3-1.7B"
 
 SCHEMA = {
     "type": "object",
@@ -20,26 +23,208 @@ SCHEMA = {
     "required": ["code"],
 }
 
-messages = [
-    {"role": "user", "content": prompt}
-]
-chat_completion = client.chat.completions.create(
-    messages=messages,
-    model="Qwen/Qwen3-1.7B",
-    response_format={
-        "type": "json_object",
-        "schema": CodeResponse.model_json_schema(),
-    },
-    max_tokens=128,
-    temperature=0.7,
+# Errors worth another attempt: the server was slow, unreachable or overloaded
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
 )
 
-print("Content:", chat_completion.choices[0].message.content)
 
-# Validate with Pydantic
-try:
-    data = json.loads(chat_completion.choices[0].message.content)
-    parsed = CodeResponse(**data)
-    print("Validated code:", parsed.code)
-except (json.JSONDecodeError, ValidationError) as e:
-    print("Failed to parse/validate model output:", e)
\ No newline at end of file
+def build_request(prompt):
+    """Keyword arguments for chat.completions.create for a single prompt."""
+    return dict(
+        messages=[{"role": "user", "content": prompt}],
+        model=MODEL,
+        response_format={
+            "type": "json_object",
+            "schema": CodeResponse.model_json_schema(),
+        },
+        max_tokens=128,
+        temperature=0.7,
+    )
+
+
+def parse_response(content):
+    """Parse and validate model output; raises JSONDecodeError or ValidationError."""
+    data = json.loads(content)
+    return CodeResponse(**data)
+
+
+def complete(client, prompt, cache=None, metrics=None):
+    """Run one prompt, answering from a chat_cache.ResponseCache when given one.
+
+    Without streaming only total and validation time reach `metrics`.
+    """
+    request = build_request(prompt)
+    if cache is not None:
+        content = cache.get(request)
+        if content is not None:
+            return parse_response(content)
+
+    timer = RequestTimer(metrics)
+    chat_completion = client.chat.completions.create(**request)
+    timer.finish()
+    content = chat_completion.choices[0].message.content
+    with timer.validation():
+        parsed = parse_response(content)
+    # Only outputs that passed validation are cached
+    if cache is not None:
+        cache.put(request, content)
+    return parsed
+
+
+async def complete_async(
+    client, prompt, timeout=30.0, retries=3, backoff=0.5, cache=None, metrics=None
+):
+    """Run one prompt on an AsyncOpenAI client, retrying transient errors.
+
+    Retries sleep for a random time up to backoff * 2**attempt ("full jitter")
+    so a burst of failures doesn't come back as a synchronized burst. Total
+    time in `metrics` runs from the first attempt, so it includes retries.
+    The cache is called from a worker thread, as its disk tier blocks.
+    """
+    request = build_request(prompt)
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, request)
+        if content is not None:
+            return parse_response(content)
+
+    timer = RequestTimer(metrics)
+    for attempt in range(retries + 1):
+        try:
+            chat_completion = await client.chat.completions.create(**request, timeout=timeout)
+            timer.finish()
+            content = chat_completion.choices[0].message.content
+            with timer.validation():
+                parsed = parse_response(content)
+            if cache is not None:
+                await asyncio.to_thread(cache.put, request, content)
+            return parsed
+        except RETRYABLE_ERRORS:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(random.uniform(0, backoff * 2**attempt))
+
+
+async def run_batch(
+    prompts,
+    concurrency=32,
+    timeout=30.0,
+    retries=3,
+    backoff=0.5,
+    base_url=BASE_URL,
+    cache=None,
+    metrics=None,
+):
+    """Run many prompts concurrently and return results in input order.
+
+    At most `concurrency` requests are in flight, all sharing one client and
+    its connection pool. Each result is a CodeResponse, or the exception that
+    prompt finally failed with. Prompts found in `cache` skip the server.
+    Every request's timings go to `metrics` when given.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # max_retries=0 because complete_async does its own retries with jitter
+    async with openai.AsyncOpenAI(
+        api_key="EMPTY", base_url=base_url, max_retries=0
+    ) as client:
+
+        async def run_one(prompt):
+            async with semaphore:
+                return await complete_async(
+                    client, prompt, timeout, retries, backoff, cache, metrics
+                )
+
+        return await asyncio.gather(
+            *(run_one(prompt) for prompt in prompts), return_exceptions=True
+        )
+
+
+def stream_code(client, prompt, metrics=None):
+    """Stream a completion and validate it as the tokens arrive.
+
+    Returns the CodeResponse as soon as the closing brace arrives, and
+    raises SchemaMismatch the moment the output can no longer match the
+    schema. Either way the stream is closed, which cancels the request.
+    Timings go to a chat_metrics.ChatMetrics when one is given.
+    """
+    validator = IncrementalValidator(CodeResponse.model_json_schema())
+    timer = RequestTimer(metrics)
+    content = []
+    stream = client.chat.completions.create(**build_request(prompt), stream=True)
+    try:
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                timer.token()
+                content.append(delta[:validator.feed(delta)])
+                if validator.done:
+                    break
+    finally:
+        stream.close()
+        timer.finish()
+    with timer.validation():
+        validator.finish()
+        return parse_response("".join(content))
+
+
+async def stream_code_async(client, prompt, timeout=30.0, metrics=None):
+    """Async version of stream_code for an AsyncOpenAI client."""
+    validator = IncrementalValidator(CodeResponse.model_json_schema())
+    timer = RequestTimer(metrics)
+    content = []
+    stream = await client.chat.completions.create(
+        **build_request(prompt), stream=True, timeout=timeout
+    )
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                timer.token()
+                content.append(delta[:validator.feed(delta)])
+                if validator.done:
+                    break
+    finally:
+        await stream.close()
+        timer.finish()
+    with timer.validation():
+        validator.finish()
+        return parse_response("".join(content))
+
+
+def main():
+    client = openai.OpenAI(
+        api_key="EMPTY",
+        base_url=BASE_URL,
+    )
+    metrics = ChatMetrics()
+
+    timer = RequestTimer(metrics)
+    chat_completion = client.chat.completions.create(**build_request(prompt))
+    timer.finish()
+
+    print("Content:", chat_completion.choices[0].message.content)
+
+    # Validate with Pydantic
+    try:
+        with timer.validation():
+            parsed = parse_response(chat_completion.choices[0].message.content)
+        print("Validated code:", parsed.code)
+    except (json.JSONDecodeError, ValidationError) as e:
+        print("Failed to parse/validate model output:", e)
+
+    # Same prompt again, streamed and validated as it arrives
+    try:
+        parsed = stream_code(client, prompt, metrics=metrics)
+        print("Streamed code:", parsed.code)
+    except (SchemaMismatch, json.JSONDecodeError, ValidationError) as e:
+        print("Aborted streamed output:", e)
+
+    print("Metrics:", metrics.to_json())
+
+
+if __name__ == "__main__":
+    main()
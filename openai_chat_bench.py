@@ -0,0 +1,55 @@
+"""
+Compare one-at-a-time requests against openai_chat.run_batch, offline.
+
+Starts openai_stub_server in the background and sends the same prompts
+through both paths.
+
+python openai_chat_bench.py --prompts 200 --concurrency 32 --latency 0.1
+"""
+import argparse
+import asyncio
+import time
+
+import openai
+
+from openai_chat import build_request, parse_response, prompt, run_batch
+from openai_stub_server import serve
+
+
+def run_sequential(prompts, base_url):
+    client = openai.OpenAI(api_key="EMPTY", base_url=base_url)
+    results = []
+    for p in prompts:
+        chat_completion = client.chat.completions.create(**build_request(p))
+        results.append(parse_response(chat_completion.choices[0].message.content))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = serve(port=0, latency=args.latency, error_rate=args.error_rate, background=True)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    prompts = [f"{prompt} ({i})" for i in range(args.prompts)]
+
+    if args.error_rate == 0:
+        start = time.perf_counter()
+        run_sequential(prompts, base_url)
+        elapsed = time.perf_counter() - start
+        print(f"sequential: {len(prompts) / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(prompts, concurrency=args.concurrency, base_url=base_url))
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(r, BaseException) for r in results)
+    print(f"batch:      {len(prompts) / elapsed:8.1f} req/s ({elapsed:.2f}s, {failed} failed)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
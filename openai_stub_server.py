@@ -0,0 +1,136 @@
+"""
+Minimal OpenAI-compatible server for benchmarking openai_chat offline.
+
+Answers POST /v1/chat/completions after a fixed delay with a canned
+CodeResponse JSON body, or streams it as server-sent events a few
+characters at a time when the request sets "stream": true. A share of
+requests can be made to fail with 503 to exercise client retries, and a
+share of generations can be made malformed to exercise early aborts.
+
+python openai_stub_server.py --port 8000 --latency 0.2 --token-latency 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT = json.dumps({"code": "def square(x):\n    return x * x"})
+# Goes wrong early ("code" must be a string) and then keeps generating
+MALFORMED_CONTENT = '{"code": 42, "notes": "' + "padding " * 64 + '"}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients can reuse connections
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(body or b"{}")
+
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.send_json(503, {"error": {"message": "overloaded"}})
+            return
+
+        content = CONTENT
+        if random.random() < self.server.malformed_rate:
+            content = MALFORMED_CONTENT
+        if request.get("stream"):
+            self.send_stream(request, content)
+            return
+
+        self.send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def send_stream(self, request, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        events = [{"role": "assistant", "content": piece} for piece in pieces]
+        try:
+            for i, delta in enumerate(events):
+                time.sleep(self.server.token_latency)
+                self.send_event({
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "delta": delta,
+                        "finish_reason": "stop" if i == len(events) - 1 else None,
+                    }],
+                })
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, e.g. after aborting a bad generation
+            self.close_connection = True
+
+    def send_event(self, payload):
+        self.send_chunk(b"data: " + json.dumps(payload).encode() + b"\n\n")
+
+    def send_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(
+    port=8000,
+    latency=0.2,
+    error_rate=0.0,
+    token_latency=0.01,
+    malformed_rate=0.0,
+    background=False,
+):
+    """Start the stub server; with background=True return it running in a thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.token_latency = token_latency
+    server.malformed_rate = malformed_rate
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.error_rate, args.token_latency, args.malformed_rate)
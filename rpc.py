@@ -40,40 +40,360 @@ def fine_earliest_to(log, to):
     return False
 """
 
-def fine_earliest_to2(log, to):
-    dic = {}
-    arr = []
+import argparse
+import bisect
+import os
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing import Pool
+
+
+def detect_timeouts(log, to):
+    """Yield (id, ts) for every RPC that runs longer than `to`.
+
+    `log` is any iterable of (id, ts, type) sorted by ts, and ts is the
+    timestamp of the entry at which the timeout was noticed. Starts arrive
+    in timestamp order, so the first entry of `open_rpcs` is always the
+    oldest RPC still running. Each entry costs O(1) amortized, and memory
+    is proportional to the number of RPCs in flight.
+    """
+    open_rpcs = OrderedDict()  # id -> start ts, oldest first
     for id, ts, type in log:
         if type == "Start":
-            dic[id] = len(arr) - 1
-            arr.append([id, ts])
-        if ts - arr[0][1] > to:
-            return True
+            open_rpcs[id] = ts
+        # Report every open RPC that has run too long by now, oldest first
+        while open_rpcs:
+            oldest_id, start = next(iter(open_rpcs.items()))
+            if ts - start <= to:
+                break
+            open_rpcs.popitem(last=False)
+            yield oldest_id, ts
         if type == "End":
-            idx = dic[id]
-            if idx is not None:
-                last_id, last_ts = arr[-1]
-                arr[idx] = arr[-1]
-                dic[last_id] = idx
-                arr.pop()
-    return False
+            # Already gone if it was reported as timed out
+            open_rpcs.pop(id, None)
+
+
+def fine_earliest_to2(log, to):
+    return next(detect_timeouts(log, to), None) is not None
+
+
+def _number(text):
+    return int(text) if text.lstrip("-").isdigit() else float(text)
+
+
+def parse_log_line(line):
+    """Parse "ID 1,   0,  Start" (or "1,0,Start") into (id, ts, type).
+
+    Returns None for blank, comment or malformed lines.
+    """
+    parts = [part.strip() for part in line.split(",")]
+    if len(parts) != 3 or parts[2] not in ("Start", "End"):
+        return None
+    id, ts, type = parts
+    if id[:2].upper() == "ID":
+        id = id[2:].strip()
+    try:
+        return _number(id) if id.lstrip("-").isdigit() else id, _number(ts), type
+    except ValueError:
+        return None
+
+
+class TimerWheel:
+    """Hashed timing wheel keyed by RPC id.
+
+    A timer due at `deadline` lives in slot (deadline // tick) % len(slots).
+    schedule and cancel are O(1). advance(now) visits only the slots for the
+    ticks since the last call and fires timers whose deadline < now. Timers
+    more than one revolution away stay in their slot until their round comes.
+    """
+
+    def __init__(self, tick=0.1, slots=512, now=0.0):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # id -> deadline
+        self._slot_of = {}  # id -> slot index
+        self._tick_no = int(now // tick)
+        self.now = now
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, id, deadline):
+        self.cancel(id)
+        # A deadline already behind us goes in the slot advance() looks at next
+        slot = max(int(deadline // self.tick), self._tick_no) % len(self.slots)
+        self.slots[slot][id] = deadline
+        self._slot_of[id] = slot
+
+    def cancel(self, id):
+        """Remove a timer; returns its deadline, or None if it wasn't pending."""
+        slot = self._slot_of.pop(id, None)
+        if slot is None:
+            return None
+        return self.slots[slot].pop(id)
+
+    def advance(self, now):
+        """Move the wheel to `now` and return the ids that expired, earliest first."""
+        if now < self.now:
+            return []
+        target = int(now // self.tick)
+        num_slots = len(self.slots)
+        if target - self._tick_no < num_slots:
+            ticks = range(self._tick_no, target + 1)
+        else:
+            # Idle for a whole revolution or more: every slot is due a look
+            ticks = range(num_slots)
+
+        fired = []
+        for tick_no in ticks:
+            slot = self.slots[tick_no % num_slots]
+            for id, deadline in [item for item in slot.items() if item[1] < now]:
+                del slot[id]
+                del self._slot_of[id]
+                fired.append((deadline, id))
+        self._tick_no = target
+        self.now = now
+        fired.sort(key=lambda item: item[0])
+        return [id for _, id in fired]
+
+
+def tail_lines(path, poll_interval=0.1, stop=None):
+    """Yield lines as they are appended to path, like tail -F.
+
+    Yields None after every poll that found nothing new, so the caller can
+    do timer work while the log is quiet. When the file is rotated (path
+    now names a different file) the rest of the old file is read and the
+    new one followed from its start; when it is truncated, reading restarts
+    from the top. Stops when the threading.Event `stop` is set.
+    """
+    f = None
+    partial = b""
+    while stop is None or not stop.is_set():
+        if f is None:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                yield None
+                time.sleep(poll_interval)
+                continue
+            inode = os.fstat(f.fileno()).st_ino
+
+        line = f.readline()
+        if line:
+            # Hold back a half-written last line until its newline arrives
+            if line.endswith(b"\n"):
+                yield (partial + line).decode()
+                partial = b""
+            else:
+                partial += line
+            continue
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and st.st_ino != inode:
+            for line in f:
+                yield (partial + line).decode()
+                partial = b""
+            f.close()
+            f = None
+            partial = b""
+            continue
+        if st is not None and st.st_size < f.tell():
+            f.seek(0)
+            partial = b""
+        yield None
+        time.sleep(poll_interval)
+    if f is not None:
+        f.close()
+
+
+def follow_log(path, to, on_timeout, tick=0.1, clock=time.time, stop=None):
+    """Tail a live log and call on_timeout(id, now) as soon as an RPC runs past `to`.
+
+    Log timestamps are taken to be on the same clock as `clock`. Each Start
+    schedules a timer at start + to on a TimerWheel, each End cancels it, and
+    the wheel is advanced on the wall clock at least once per tick, whether
+    lines are pouring in or the log is silent. Detection latency is bounded
+    by about one tick either way.
+
+    Like detect_timeouts, an End arriving more than `to` after its Start
+    also counts, for entries read in a burst before the wheel caught up.
+    """
+    wheel = TimerWheel(tick, now=clock())
+    next_check = 0.0
+    for line in tail_lines(path, tick, stop):
+        entry = parse_log_line(line) if line is not None else None
+        if entry is not None:
+            id, ts, type = entry
+            # Log time counts too, in case the log runs ahead of our clock
+            for expired in wheel.advance(ts):
+                on_timeout(expired, ts)
+            if type == "Start":
+                wheel.schedule(id, ts + to)
+            else:
+                deadline = wheel.cancel(id)
+                if deadline is not None and ts > deadline:
+                    on_timeout(id, ts)
+
+        now = clock()
+        if line is None or now >= next_check:
+            for expired in wheel.advance(now):
+                on_timeout(expired, now)
+            next_check = now + tick
+
+
+def read_log(path):
+    """Yield (id, ts, type) for each parseable line of a log file."""
+    with open(path) as f:
+        for line in f:
+            entry = parse_log_line(line)
+            if entry is not None:
+                yield entry
+
+
+def analyze_log(path, to):
+    """Sequential scan of a log file: every timed-out (id, detected_ts)."""
+    return list(detect_timeouts(read_log(path), to))
+
+
+def _shard_bounds(path, shards):
+    # Split [0, size) into byte ranges whose edges sit at line starts
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, shards):
+            f.seek(max(size * i // shards, bounds[-1]))
+            if f.tell() > 0:
+                f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def _scan_shard(path, start, end, to, shard):
+    """Run the detector over one byte range of a log.
+
+    Besides the timeouts it can settle on its own, it reports what the merge
+    needs to finish RPCs that cross its edges:
+      open_at_end  RPCs started here and still running at the end
+      ends         End times of RPCs that started before this shard
+      window       distinct timestamps up to first_ts + to, plus the next
+                   one; an RPC carried in has its deadline below
+                   first_ts + to, so its detection time is in here
+    """
+    found = []  # (detected_ts, shard, seq, id)
+    open_rpcs = OrderedDict()  # id -> (start ts, seq)
+    timed_out = set()  # reported here, End not seen yet
+    ends = {}
+    window = []
+    first_ts = None
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        seq = 0
+        for raw in f:
+            pos += len(raw)
+            entry = parse_log_line(raw.decode())
+            if entry is not None:
+                id, ts, type = entry
+                if first_ts is None:
+                    first_ts = ts
+                if ts <= first_ts + to or window[-1] <= first_ts + to:
+                    if not window or window[-1] != ts:
+                        window.append(ts)
+
+                if type == "Start":
+                    open_rpcs[id] = (ts, seq)
+                    seq += 1
+                while open_rpcs:
+                    oldest_id, (oldest_ts, oldest_seq) = next(iter(open_rpcs.items()))
+                    if ts - oldest_ts <= to:
+                        break
+                    open_rpcs.popitem(last=False)
+                    timed_out.add(oldest_id)
+                    found.append((ts, shard, oldest_seq, oldest_id))
+                if type == "End":
+                    if open_rpcs.pop(id, None) is None:
+                        if id in timed_out:
+                            timed_out.discard(id)
+                        else:
+                            ends[id] = ts
+            if pos >= end:
+                break
+
+    open_at_end = [(id, ts, seq) for id, (ts, seq) in open_rpcs.items()]
+    return found, open_at_end, ends, window
+
+
+def analyze_log_parallel(path, to, workers=None, shards=None):
+    """Same result as analyze_log, from byte-range shards scanned in parallel.
+
+    The log must be sorted by timestamp. RPCs still running at a shard's
+    end are carried into the following shards during the merge, using each
+    shard's End times and timestamp window, so results (and their order)
+    match a sequential scan exactly.
+    """
+    workers = workers or os.cpu_count() or 1
+    bounds = _shard_bounds(path, shards or workers)
+    tasks = [(path, start, end, to, i) for i, (start, end) in enumerate(bounds)]
+    if workers == 1:
+        results = [_scan_shard(*task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            results = pool.starmap(_scan_shard, tasks)
+
+    found = []
+    carried = OrderedDict()  # id -> (start ts, shard, seq), oldest first
+    for shard, (local_found, open_at_end, ends, window) in enumerate(results):
+        found.extend(local_found)
+        for id, (start, origin, seq) in list(carried.items()):
+            # First event in this shard past the deadline, if any
+            i = bisect.bisect_right(window, start + to)
+            detected_ts = window[i] if i < len(window) else None
+            end_ts = ends.get(id)
+            if detected_ts is not None and (end_ts is None or detected_ts <= end_ts):
+                found.append((detected_ts, origin, seq, id))
+                del carried[id]
+            elif end_ts is not None:
+                del carried[id]
+        for id, start, seq in open_at_end:
+            carried[id] = (start, shard, seq)
+
+    found.sort(key=lambda item: item[:3])
+    return [(id, ts) for ts, _, _, id in found]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report RPCs that time out.")
+    parser.add_argument("--follow", metavar="LOG", required=True, help="tail a live log file")
+    parser.add_argument("--timeout", type=float, default=3)
+    parser.add_argument("--tick", type=float, default=0.1)
+    args = parser.parse_args()
+
+    def alert(id, now):
+        print(f"TIMEOUT id={id} detected_at={now:.3f}", flush=True)
+
+    try:
+        follow_log(args.follow, args.timeout, alert, tick=args.tick)
+    except KeyboardInterrupt:
+        pass
+
 
-print(fine_earliest_to2(
-[
-    [1, 0, "Start"],
-    [2, 1, "Start"],
-    [1, 2, "End"],
-    [3, 6, "Start"],
-    [2, 7, "End"],
-    [3, 8, "End"],
-], 3))
-
-print(fine_earliest_to2(
-[
-    [1, 0, "Start"],
-    [2, 1, "Start"],
-    [1, 2, "End"],
-    [3, 6, "Start"],
-    [2, 7, "End"],
-    [3, 8, "End"],
-], 9))
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+    else:
+        example = [
+            [1, 0, "Start"],
+            [2, 1, "Start"],
+            [1, 2, "End"],
+            [3, 6, "Start"],
+            [2, 7, "End"],
+            [3, 8, "End"],
+        ]
+        print(fine_earliest_to2(example, 3))
+        print(fine_earliest_to2(example, 9))
+        print(list(detect_timeouts(example, 3)))
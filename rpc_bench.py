@@ -0,0 +1,82 @@
+"""
+Benchmark rpc.analyze_log_parallel against the sequential rpc.analyze_log.
+
+Generates a sorted log of --events entries (about half Start, half End;
+a small share of RPCs never end), checks both analyzers agree, and prints
+their wall times. The log is kept for later runs with the same --events
+and --timeout.
+
+python rpc_bench.py --events 10000000 --workers 8
+"""
+import argparse
+import heapq
+import os
+import random
+import time
+
+from rpc import analyze_log, analyze_log_parallel
+
+
+def generate_log(path, events, timeout, seed=0):
+    rng = random.Random(seed)
+    pending = []  # (end ts, id)
+    lines = []
+    written = 0
+    ts = 0
+    id = 0
+    with open(path, "w") as f:
+        while written < events:
+            ts += rng.randint(0, 2)
+            # Emit every End due before this Start, in time order
+            while pending and pending[0][0] <= ts and written < events:
+                end_ts, end_id = heapq.heappop(pending)
+                lines.append(f"{end_id}, {end_ts}, End\n")
+                written += 1
+            if written >= events:
+                break
+            lines.append(f"{id}, {ts}, Start\n")
+            written += 1
+            if rng.random() < 0.999:
+                # Mostly well under the timeout, with a long tail past it
+                duration = int(rng.expovariate(1 / (timeout / 4)))
+                heapq.heappush(pending, (ts + duration, id))
+            id += 1
+            if len(lines) >= 100000:
+                f.writelines(lines)
+                lines.clear()
+        f.writelines(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000000)
+    parser.add_argument("--timeout", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    # Named after what it holds, so a log made with other settings isn't reused
+    parser.add_argument("--log", help="log file (default: rpc_bench_<events>_<timeout>.log)")
+    parser.add_argument("--regenerate", action="store_true", help="write the log even if it exists")
+    args = parser.parse_args()
+    if args.log is None:
+        args.log = f"rpc_bench_{args.events}_{args.timeout}.log"
+
+    if args.regenerate or not os.path.exists(args.log):
+        start = time.perf_counter()
+        generate_log(args.log, args.events, args.timeout)
+        print(f"generated {args.events} events in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    sequential = analyze_log(args.log, args.timeout)
+    sequential_s = time.perf_counter() - start
+    print(f"sequential:            {sequential_s:7.2f}s  {len(sequential)} timeouts")
+
+    start = time.perf_counter()
+    parallel = analyze_log_parallel(args.log, args.timeout, workers=args.workers)
+    parallel_s = time.perf_counter() - start
+    print(f"parallel ({args.workers} workers): {parallel_s:7.2f}s  {len(parallel)} timeouts")
+
+    assert parallel == sequential, "parallel result differs from the sequential scan"
+    print(f"speedup: {sequential_s / parallel_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Vectorized RPC latency statistics over whole log archives.
+
+The <RpcId, Timestamp, Start/End> log (the format rpc.py reads, with
+numeric ids) is loaded into NumPy columns, and Start/End events are paired
+by sorting and searchsorted instead of a Python loop per event.
+
+RPCs with a Start but no End are kept apart: they have no duration, but
+they are counted as timed out for a threshold once the log's last
+timestamp is more than the threshold past their start. That is the rule
+rpc.detect_timeouts applies, so timeout counts agree with it.
+
+python rpc_stats.py rpc_bench_10000000_100.log --thresholds 10 50 100
+"""
+import argparse
+import json
+
+import numpy as np
+
+
+def load_columns(path, chunk_bytes=64 * 1024 * 1024):
+    """Parse a log file into {"ids", "ts", "is_start"} arrays, chunk by chunk.
+
+    Blank lines and "#" comments are skipped. Any other line that isn't
+    <RpcId, Timestamp, Start/End> with an integer id raises ValueError
+    naming the line. Ids are parsed as integers, not through floats, so
+    ids past 2**53 stay distinct.
+    """
+    ids, ts, is_start = [], [], []
+    line_no = 0  # lines before the current chunk
+    with open(path, "rb") as f:
+        leftover = b""
+        while True:
+            chunk = f.read(chunk_bytes)
+            data = leftover + chunk
+            if chunk:
+                # Parse whole lines only; the tail waits for the next chunk
+                cut = data.rfind(b"\n") + 1
+                data, leftover = data[:cut], data[cut:]
+            elif data and not data.endswith(b"\n"):
+                data += b"\n"
+            if data.strip():
+                columns = _parse_lines(data) or _parse_lines_one_by_one(path, data, line_no)
+                ids.append(columns[0])
+                ts.append(columns[1])
+                is_start.append(columns[2])
+            line_no += data.count(b"\n")
+            if not chunk:
+                break
+
+    if not ids:
+        return {"ids": np.empty(0, np.int64), "ts": np.empty(0), "is_start": np.empty(0, bool)}
+    return {"ids": np.concatenate(ids), "ts": np.concatenate(ts), "is_start": np.concatenate(is_start)}
+
+
+def _parse_lines(data):
+    # Fast path for chunks of well-formed lines; None if any line is blank,
+    # a comment or malformed. Each line ends in a ";" token, so a line with
+    # too few or too many fields can't shift the ones after it into place.
+    tokens = data.replace(b"ID", b"").replace(b",", b" ").replace(b"\n", b" ; ").split()
+    rows = len(tokens) // 4
+    if len(tokens) % 4 or tokens[3::4].count(b";") != rows:
+        return None
+    types = tokens[2::4]
+    starts = types.count(b"Start")
+    if starts + types.count(b"End") != rows:
+        return None
+    try:
+        # From bytes, NumPy parses each id as an exact integer
+        ids = np.array(tokens[0::4]).astype(np.int64)
+        ts = np.array(tokens[1::4]).astype(np.float64)
+    except (ValueError, OverflowError):
+        return None
+    return ids, ts, np.array(types) == b"Start"
+
+
+def _parse_lines_one_by_one(path, data, lines_before):
+    ids, ts, is_start = [], [], []
+    for line_no, line in enumerate(data.split(b"\n")[:-1], lines_before + 1):
+        text = line.strip()
+        if not text or text.startswith(b"#"):
+            continue
+        parts = [part.strip() for part in text.split(b",")]
+        try:
+            if len(parts) != 3 or parts[2] not in (b"Start", b"End"):
+                raise ValueError
+            id = parts[0][2:] if parts[0][:2].upper() == b"ID" else parts[0]
+            ids.append(np.int64(int(id)))
+            ts.append(float(parts[1]))
+        except (ValueError, OverflowError):
+            raise ValueError(
+                f"{path}, line {line_no}: expected <RpcId, Timestamp, Start/End> with an"
+                f" integer id, got {line.decode('utf-8', 'replace')!r}"
+            ) from None
+        is_start.append(parts[2] == b"Start")
+    return np.array(ids, np.int64), np.array(ts, np.float64), np.array(is_start, bool)
+
+
+def pair_events(columns):
+    """Match each Start to the End with the same id.
+
+    Returns start_ids, start_ts, durations (NaN where no End was found) and
+    the ids of Ends that had no Start. Assumes an id is used by one RPC.
+    """
+    ids, ts, is_start = columns["ids"], columns["ts"], columns["is_start"]
+    start_ids, start_ts = ids[is_start], ts[is_start]
+    end_ids, end_ts = ids[~is_start], ts[~is_start]
+
+    order = np.argsort(end_ids, kind="stable")
+    sorted_end_ids, sorted_end_ts = end_ids[order], end_ts[order]
+    durations = np.full(len(start_ids), np.nan)
+    if len(end_ids):
+        pos = np.minimum(np.searchsorted(sorted_end_ids, start_ids), len(end_ids) - 1)
+        matched = sorted_end_ids[pos] == start_ids
+        durations[matched] = sorted_end_ts[pos[matched]] - start_ts[matched]
+
+    orphan_ends = end_ids[~np.isin(end_ids, start_ids)]
+    return {
+        "start_ids": start_ids,
+        "start_ts": start_ts,
+        "durations": durations,
+        "orphan_end_ids": orphan_ends,
+    }
+
+
+def latency_stats(columns, thresholds=(1,)):
+    """Durations summary plus timeout counts for every threshold at once."""
+    pairs = pair_events(columns)
+    durations = pairs["durations"]
+    finished = ~np.isnan(durations)
+    done = np.sort(durations[finished])
+    last_ts = columns["ts"].max() if len(columns["ts"]) else 0.0
+    # Unfinished RPCs have run at least this long when the log ends
+    running = np.sort(last_ts - pairs["start_ts"][~finished])
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    timed_out = (len(done) - np.searchsorted(done, thresholds, side="right")) + (
+        len(running) - np.searchsorted(running, thresholds, side="right")
+    )
+
+    p50, p99 = np.percentile(done, [50, 99]) if len(done) else (None, None)
+    return {
+        "rpcs": int(len(durations)),
+        "finished": int(len(done)),
+        "unfinished": int(len(running)),
+        "orphan_ends": int(len(pairs["orphan_end_ids"])),
+        "p50": None if p50 is None else float(p50),
+        "p99": None if p99 is None else float(p99),
+        "max": float(done[-1]) if len(done) else None,
+        "timeouts": {float(t): int(n) for t, n in zip(thresholds, timed_out)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[3])
+    args = parser.parse_args()
+    print(json.dumps(latency_stats(load_columns(args.log), args.thresholds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
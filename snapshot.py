@@ -1,41 +1,432 @@
+import bisect
+import heapq
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class _Missing:
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        # Unpickle to the same object, so tombstones survive checkpoints
+        return "_MISSING"
+
+
+_MISSING = _Missing()
+
+
+class _SortedKeys:
+    """A sorted list kept as a list of bounded sorted blocks.
+
+    Inserting or removing a key bisects the block maxima, then shifts at
+    most one block's entries, rather than the whole list.
+    """
+
+    BLOCK = 512
+
+    def __init__(self, keys):
+        keys = sorted(keys)
+        self._blocks = [keys[i:i + self.BLOCK] for i in range(0, len(keys), self.BLOCK)]
+        self._maxes = [block[-1] for block in self._blocks]
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            return
+        i = min(bisect.bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[i]
+        bisect.insort(block, key)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * self.BLOCK:
+            tail = block[self.BLOCK:]
+            del block[self.BLOCK:]
+            self._blocks.insert(i + 1, tail)
+            self._maxes.insert(i + 1, tail[-1])
+            self._maxes[i] = block[-1]
+
+    def remove(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        block = self._blocks[i]
+        del block[bisect.bisect_left(block, key)]
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def chunk(self, after, start, count):
+        """Up to count keys from just past after[0], or from start (or the first) if after is None."""
+        if after is not None:
+            find, key = bisect.bisect_right, after[0]
+        elif start is not None:
+            find, key = bisect.bisect_left, start
+        else:
+            find, key = None, None
+        if find is None:
+            i, j = 0, 0
+        else:
+            i = find(self._maxes, key)
+            j = find(self._blocks[i], key) if i < len(self._blocks) else 0
+        keys = []
+        while i < len(self._blocks) and len(keys) < count:
+            keys += self._blocks[i][j:j + count - len(keys)]
+            i += 1
+            j = 0
+        return keys
+
+
 class SnapshotMap:
     """A map implementation that supports efficient snapshots.
     
-    Implementation uses delta storage and version tracking to achieve
-    sublinear scaling with number of keys while supporting snapshots.
+    Every key keeps an append-only history of (version, value), with a
+    tombstone for each delete. A snapshot only records the version number
+    current when it was taken, so taking one is O(1) and reading from one is
+    a bisect over that key's history.
+
+    A change log indexed by version lets diff() find the keys written between
+    two snapshots without looking at the rest of the map.
+
+    History that no live snapshot can see any more is pruned incrementally:
+    a few keys on every write and a batch on every release(), or all at
+    once with compact(). With no live snapshots a key keeps only its
+    current value, so memory tracks live data rather than write history.
+
+    Safe to share between threads: writers (put, delete, snapshot, release,
+    compact) serialize on a lock, while get() takes none. A write only
+    appends to a key's history, values before versions, or swaps in a new
+    one, so a reader bisecting the history it fetched always sees a
+    consistent prefix. Don't release a snapshot other threads still read.
     """
+
+    # Marks a delete in a key's history
+    _TOMBSTONE = _MISSING
+
+    # How diff() reports a key that is absent on one side
+    MISSING = _TOMBSTONE
+
+    # Keys examined for pruning per write and per release()
+    COMPACT_PER_WRITE = 1
+    COMPACT_PER_RELEASE = 64
+
+    # Keys items() takes per trip through the writer lock
+    ITER_CHUNK = 256
     
     def __init__(self):
+        # Held by writers only; reentrant so subclasses can wrap writes
+        self._lock = threading.RLock()
+
         # Current state of the map
-        self._current = {}  # {key: (value, version)}
+        self._current = {}  # {key: value}
+        
+        # Version history of every key ever written
+        self._history = {}  # {key: ([version, ...], [value or _TOMBSTONE, ...])}
         
-        # Snapshot delta storage
-        self._snapshots = {}  # {snapshot_id: {key: (value, version)}}
+        # Version each snapshot sees
+        self._snapshots = {}  # {snapshot_id: version}
+
+        # Live snapshots per version, plus a lazily cleaned min-heap of
+        # those versions to find the oldest one
+        self._live_versions = {}  # {version: number of live snapshots}
+        self._live_heap = []
+
+        # Keys whose history may hold entries that can be pruned
+        self._dirty = OrderedDict()  # {key: None}
+
+        # Key written by each version after _changes_base: _changes[i] was
+        # written by version _changes_base + 1 + i
+        self._changes = []
+        self._changes_base = 0
+
+        # Every key with history, in the order it first gained one. A key
+        # that loses its history stays in place, listed in _stale_keys,
+        # until the log is rebuilt without stale keys, so items() can walk
+        # it by position without any ordering
+        self._key_log = []
+        self._stale_keys = set()
+
+        # Every key with history in sorted order, as a _SortedKeys; only
+        # built once a range is first asked for, since it needs keys that
+        # compare
+        self._sorted_keys = None
+
+        # History size, kept up to date for stats()
+        self._entries = 0
+        self._tombstones = 0
         
         # Current version number for tracking changes
         self._version = 0
         
         # Counter for generating snapshot IDs
         self._next_snapshot_id = 0
+
+    def _append(self, key, value):
+        tombstone = value is self._TOMBSTONE
+        history = self._history.get(key)
+        if not self._snapshots:
+            # Nothing can see older versions: keep only the latest, and
+            # nothing at all after a delete. No snapshot needs the change
+            # log either.
+            self._changes.clear()
+            self._changes_base = self._version
+            if history is not None:
+                self._forget(history[1])
+            if tombstone:
+                if history is not None:
+                    del self._history[key]
+                    self._unindex_key(key)
+            else:
+                # Replaced in one step, so readers never find the key missing
+                self._history[key] = ([self._version], [value])
+                self._entries += 1
+                if history is None:
+                    self._index_key(key)
+            # Keep draining history left behind by released snapshots
+            if self._dirty:
+                self._compact(self.COMPACT_PER_WRITE)
+            return
+
+        self._changes.append(key)
+        if history is None:
+            history = self._history[key] = ([], [])
+            self._index_key(key)
+        versions, values = history
+        # Values first: a reader that sees the new version sees its value too
+        values.append(value)
+        versions.append(self._version)
+        self._entries += 1
+        self._tombstones += tombstone
+        if len(versions) > 1 or tombstone:
+            self._dirty[key] = None
+        if self._dirty:
+            self._compact(self.COMPACT_PER_WRITE)
+
+    def _index_key(self, key):
+        if key in self._stale_keys:
+            # Its old entry is still in the log
+            self._stale_keys.discard(key)
+        else:
+            self._key_log.append(key)
+        if self._sorted_keys is not None:
+            try:
+                self._sorted_keys.add(key)
+            except TypeError:
+                # Keys no longer compare; only ranges need the index
+                self._sorted_keys = None
+
+    def _unindex_key(self, key):
+        self._stale_keys.add(key)
+        if len(self._stale_keys) * 2 > len(self._key_log):
+            # A new list, so items() calls walking the old one carry on;
+            # amortized O(1) over the removals that made the keys stale
+            self._key_log = [key for key in self._key_log if key not in self._stale_keys]
+            self._stale_keys = set()
+        if self._sorted_keys is not None:
+            self._sorted_keys.remove(key)
+
+    def _forget(self, values):
+        self._entries -= len(values)
+        self._tombstones -= sum(value is self._TOMBSTONE for value in values)
+
+    def _horizon(self):
+        """Oldest version any live snapshot sees (the current one if there are none)."""
+        heap = self._live_heap
+        while heap and heap[0] not in self._live_versions:
+            heapq.heappop(heap)
+        return heap[0] if heap else self._version
+
+    def _prune(self, key, horizon):
+        """Drop history of key that no live snapshot can see.
+
+        Returns True if the key may have more to prune once the horizon moves.
+        """
+        versions, values = self._history[key]
+        # Every live snapshot sees entry i or something newer, so older
+        # entries are unreachable; a tombstone at i reads the same as nothing
+        i = bisect.bisect_right(versions, horizon) - 1
+        drop = i + 1 if i >= 0 and values[i] is self._TOMBSTONE else max(i, 0)
+        if drop:
+            self._entries -= drop
+            self._tombstones -= sum(value is self._TOMBSTONE for value in values[:drop])
+            versions, values = versions[drop:], values[drop:]
+            if versions:
+                self._history[key] = (versions, values)
+            else:
+                del self._history[key]
+                self._unindex_key(key)
+        return len(versions) > 1 or bool(values) and values[-1] is self._TOMBSTONE
+
+    def compact(self, max_keys=None):
+        """Prune unreachable history for up to max_keys pending keys (all if None)."""
+        with self._lock:
+            self._compact(max_keys)
+
+    def _compact(self, max_keys):
+        horizon = self._horizon()
+        pending = len(self._dirty)
+        if max_keys is not None:
+            pending = min(pending, max_keys)
+        for _ in range(pending):
+            key, _ = self._dirty.popitem(last=False)
+            if key in self._history and self._prune(key, horizon):
+                # Still has history a live snapshot needs; look again later
+                self._dirty[key] = None
+
+        # Diffs only span live snapshots, so changes up to the horizon can
+        # go; trim once that's at least half the log to keep it amortized O(1)
+        trim = horizon - self._changes_base
+        if trim > 0 and trim * 2 >= len(self._changes):
+            del self._changes[:trim]
+            self._changes_base = horizon
     
     def put(self, key, value):
         """Store a mapping from a key to a value."""
-        self._version += 1
-        self._current[key] = (value, self._version)
+        with self._lock:
+            self._version += 1
+            self._current[key] = value
+            self._append(key, value)
     
     def snapshot(self):
         """Take a snapshot of the map and return an identifier."""
-        snapshot_id = self._next_snapshot_id
-        self._next_snapshot_id += 1
-        
-        # Store only the current state's version numbers
-        # We'll use this to know which values to look up
-        self._snapshots[snapshot_id] = {
-            key: (value, version) 
-            for key, (value, version) in self._current.items()
-        }
-        
-        return snapshot_id
+        with self._lock:
+            snapshot_id = self._next_snapshot_id
+            self._next_snapshot_id += 1
+
+            # Changes after this version are invisible to the snapshot
+            if self._version not in self._live_versions:
+                self._live_versions[self._version] = 0
+                heapq.heappush(self._live_heap, self._version)
+            self._live_versions[self._version] += 1
+            # Registered last, so readers can use it as soon as they find it
+            self._snapshots[snapshot_id] = self._version
+
+            return snapshot_id
+
+    def release(self, snapshot_id):
+        """Drop a snapshot so history only it could see can be reclaimed."""
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                raise KeyError(f"Invalid snapshot ID: {snapshot_id}")
+            version = self._snapshots.pop(snapshot_id)
+            self._live_versions[version] -= 1
+            if not self._live_versions[version]:
+                del self._live_versions[version]
+            self._compact(self.COMPACT_PER_RELEASE)
+
+    def stats(self):
+        """Sizes for checking that memory tracks live data, not history."""
+        with self._lock:
+            return {
+                "keys": len(self._current),
+                "history_keys": len(self._history),
+                "versions": self._entries,
+                "tombstones": self._tombstones,
+                "live_snapshots": len(self._snapshots),
+                "oldest_live_version": self._horizon() if self._snapshots else None,
+                "pending_compaction": len(self._dirty),
+                "change_log": len(self._changes),
+            }
+
+    def _version_of(self, snapshot_id):
+        if snapshot_id not in self._snapshots:
+            raise KeyError(f"Invalid snapshot ID: {snapshot_id}")
+        return self._snapshots[snapshot_id]
+
+    def _value_at(self, key, version):
+        # Latest write of key at or before version; MISSING if none or deleted
+        history = self._history.get(key)
+        if history is None:
+            return self.MISSING
+        versions, values = history
+        i = bisect.bisect_right(versions, version) - 1
+        return values[i] if i >= 0 else self.MISSING
+
+    def _lookup(self, key, version):
+        if version is None:
+            return self._current.get(key, self.MISSING)
+        return self._value_at(key, version)
+
+    def diff(self, snap_a, snap_b):
+        """Yield (key, value in snap_a, value in snap_b) for keys that differ.
+
+        Only keys written between the two snapshots are looked at, so the cost
+        follows the number of changes, not the size of the map. Absent keys
+        are reported as SnapshotMap.MISSING.
+        """
+        version_a = self._version_of(snap_a)
+        version_b = self._version_of(snap_b)
+        low, high = sorted((version_a, version_b))
+        with self._lock:
+            # Copied, as compaction may trim the log while this generator runs
+            changed = self._changes[low - self._changes_base:high - self._changes_base]
+        seen = set()
+        for key in changed:
+            if key in seen:
+                continue
+            seen.add(key)
+            value_a = self._value_at(key, version_a)
+            value_b = self._value_at(key, version_b)
+            if value_a is not value_b and value_a != value_b:
+                yield key, value_a, value_b
+
+    def items(self, snapshot_id=None, start=None, stop=None):
+        """Lazily yield (key, value) pairs, from a snapshot or the current state.
+
+        Pairs come in the order keys were first written. With start and/or
+        stop, yields only start <= key < stop, in key order; keys must then
+        be comparable, and the first range builds a sorted key index that
+        writes keep up to date from then on.
+
+        Keys are fetched ITER_CHUNK at a time under the writer lock, so
+        writers carry on in between and nothing the size of the map is
+        copied. Values are looked up as they are yielded, so only a snapshot
+        gives a consistent view.
+        """
+        version = None if snapshot_id is None else self._version_of(snapshot_id)
+        if start is None and stop is None:
+            keys = self._logged_keys()
+        else:
+            keys = self._sorted_range(start, stop)
+        for key in keys:
+            value = self._lookup(key, version)
+            if value is not self.MISSING:
+                yield key, value
+
+    def _logged_keys(self):
+        # Keys a snapshot sees keep their history, and so their place in the
+        # log, while it is live; stale entries look up as MISSING
+        with self._lock:
+            key_log = self._key_log
+        i = 0
+        while True:
+            with self._lock:
+                keys = key_log[i:i + self.ITER_CHUNK]
+            if not keys:
+                return
+            i += len(keys)
+            yield from keys
+
+    def _sorted_range(self, start, stop):
+        # Each chunk bisects past the last key returned
+        last = None
+        while True:
+            with self._lock:
+                if self._sorted_keys is None:
+                    self._sorted_keys = _SortedKeys(self._history)
+                keys = self._sorted_keys.chunk(last, start, self.ITER_CHUNK)
+            if not keys:
+                return
+            for key in keys:
+                if stop is not None and not key < stop:
+                    return
+                yield key
+            last = (keys[-1],)
 
     def get(self, key, snapshot_id=None):
         """Retrieve the value of a key, with an optionally specified snapshot."""
@@ -43,25 +434,298 @@ class SnapshotMap:
             # Get current value
             if key not in self._current:
                 raise KeyError(key)
-            return self._current[key][0]
+            return self._current[key]
         
         # Get value from snapshot
-        if snapshot_id not in self._snapshots:
-            raise KeyError(f"Invalid snapshot ID: {snapshot_id}")
-            
-        snapshot = self._snapshots[snapshot_id]
-        if key not in snapshot:
+        value = self._value_at(key, self._version_of(snapshot_id))
+        if value is self.MISSING:
             raise KeyError(key)
             
-        return snapshot[key][0]
+        return value
 
     def delete(self, key):
         """Remove the value for the given key in the current state."""
-        if key not in self._current:
-            raise KeyError(key)
-            
-        self._version += 1
-        del self._current[key]
+        with self._lock:
+            if key not in self._current:
+                raise KeyError(key)
+
+            self._version += 1
+            del self._current[key]
+            self._append(key, self._TOMBSTONE)
+
+
+# Write-ahead log record: payload length, crc32 of payload, log sequence number
+WAL_RECORD = struct.Struct("<IIQ")
+CHECKPOINT_MAGIC = b"SNAPCKP1"
+
+# Logged operations
+OP_PUT, OP_DELETE, OP_SNAPSHOT, OP_RELEASE = range(4)
+
+
+class DurableSnapshotMap(SnapshotMap):
+    """A SnapshotMap that survives restarts.
+
+    The directory at path holds a checkpoint of the whole map and a
+    write-ahead log of every put, delete, snapshot and release since. Each
+    record is written through to the OS as it is logged, so it survives the
+    process exiting, with or without close(). The fsyncs are grouped: by the
+    writer once sync_every records are unsynced, or by a background thread
+    sync_interval seconds after the oldest unsynced one was logged,
+    whichever comes first. An OS crash loses at most that window; flush()
+    forces it. Fsyncs run outside the writer lock, so writers carry on
+    while one is in progress.
+
+    Every checkpoint_every records the map is compacted and written out as
+    a new checkpoint and the log starts over, so recovery loads one
+    checkpoint plus at most checkpoint_every records, however long the
+    history. Records carry sequence numbers, and recovery skips any the
+    checkpoint already covers, so a crash between the two steps is safe.
+    Keys and values must be picklable.
+    """
+
+    def __init__(self, path, sync_every=64, sync_interval=0.005, checkpoint_every=100000):
+        super().__init__()
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.checkpoint_every = checkpoint_every
+
+        os.makedirs(path, exist_ok=True)
+        self._checkpoint_path = os.path.join(path, "checkpoint")
+        self._wal_path = os.path.join(path, "wal")
+        self._lsn = 0
+        self._checkpoint_lsn = 0
+        self._pending_records = 0  # written but not yet fsynced
+        self._wal_records = 0
+        self._pending_since = None  # when the oldest unsynced record was logged
+        self._wal = None
+        # Serializes fsyncs with closing the log; never taken inside _lock
+        self._io_lock = threading.Lock()
+
+        self._recover()
+        self._wal = open(self._wal_path, "ab")
+        # Wakes the flusher when the first record of a group is logged
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _recover(self):
+        if os.path.exists(self._checkpoint_path):
+            with open(self._checkpoint_path, "rb") as f:
+                if f.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+                    raise ValueError(f"{self._checkpoint_path} is not a SnapshotMap checkpoint")
+                self._load_state(pickle.load(f))
+        if not os.path.exists(self._wal_path):
+            return
+
+        with open(self._wal_path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + WAL_RECORD.size <= len(data):
+            length, crc, lsn = WAL_RECORD.unpack_from(data, pos)
+            payload = data[pos + WAL_RECORD.size:pos + WAL_RECORD.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            pos += WAL_RECORD.size + length
+            if lsn > self._lsn:
+                self._replay(pickle.loads(payload))
+                self._lsn = lsn
+                self._wal_records += 1
+        if pos < len(data):
+            # Torn write from a crash; drop it so new records follow valid ones
+            with open(self._wal_path, "r+b") as f:
+                f.truncate(pos)
+                os.fsync(f.fileno())
+
+    def _replay(self, record):
+        op, arg, value = record
+        if op == OP_PUT:
+            super().put(arg, value)
+        elif op == OP_DELETE:
+            super().delete(arg)
+        elif op == OP_SNAPSHOT:
+            snapshot_id = super().snapshot()
+            if snapshot_id != arg:
+                raise ValueError(f"WAL replay expected snapshot {arg}, got {snapshot_id}")
+        elif op == OP_RELEASE:
+            super().release(arg)
+        else:
+            raise ValueError(f"Unknown WAL operation {op}")
+
+    def _log(self, op, arg, value=None):
+        # Returns whether the caller should flush() once it drops the lock
+        self._lsn += 1
+        payload = pickle.dumps((op, arg, value), pickle.HIGHEST_PROTOCOL)
+        self._wal.write(WAL_RECORD.pack(len(payload), zlib.crc32(payload), self._lsn) + payload)
+        self._wal.flush()
+        self._pending_records += 1
+        self._wal_records += 1
+        if self._wal_records >= self.checkpoint_every:
+            self._checkpoint()
+            return False
+        if self._pending_records >= self.sync_every:
+            return True
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+            self._wakeup.notify()
+        return False
+
+    def _flush_loop(self):
+        # Fsyncs a group once its oldest record is sync_interval old, so an
+        # idle map does not leave records unsynced waiting for a later write
+        while True:
+            with self._lock:
+                if self._wal is None:
+                    return
+                if self._pending_since is None:
+                    self._wakeup.wait()
+                    continue
+                delay = self._pending_since + self.sync_interval - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+            self.flush()
+
+    def flush(self):
+        """Fsync every record logged so far."""
+        with self._lock:
+            wal = self._wal
+            self._pending_records = 0
+            self._pending_since = None
+        if wal is None:
+            return
+        # Always fsyncs, even with nothing counted: another thread may have
+        # taken the count and not finished its fsync yet
+        with self._io_lock:
+            if not wal.closed:
+                os.fsync(wal.fileno())
+
+    def _state(self):
+        return {
+            "lsn": self._lsn,
+            "current": self._current,
+            "history": self._history,
+            "snapshots": self._snapshots,
+            "changes": self._changes,
+            "changes_base": self._changes_base,
+            "version": self._version,
+            "next_snapshot_id": self._next_snapshot_id,
+        }
+
+    def _load_state(self, state):
+        self._lsn = self._checkpoint_lsn = state["lsn"]
+        self._current = state["current"]
+        self._history = state["history"]
+        self._snapshots = state["snapshots"]
+        self._changes = state["changes"]
+        self._changes_base = state["changes_base"]
+        self._version = state["version"]
+        self._next_snapshot_id = state["next_snapshot_id"]
+
+        # Everything else is derived
+        self._key_log = list(self._history)
+        for version in self._snapshots.values():
+            self._live_versions[version] = self._live_versions.get(version, 0) + 1
+        self._live_heap = sorted(self._live_versions)
+        for key, (versions, values) in self._history.items():
+            self._entries += len(values)
+            tombstones = sum(value is self._TOMBSTONE for value in values)
+            self._tombstones += tombstones
+            if len(versions) > 1 or tombstones:
+                self._dirty[key] = None
+
+    def checkpoint(self):
+        """Compact, write the whole map to a new checkpoint and restart the log."""
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._compact(None)
+        tmp = self._checkpoint_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(CHECKPOINT_MAGIC)
+            pickle.dump(self._state(), f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._checkpoint_path)
+        self._fsync_dir()
+
+        # The checkpoint covers every record, unsynced ones included
+        self._wal.truncate(0)
+        self._wal.seek(0)
+        os.fsync(self._wal.fileno())
+        self._pending_records = 0
+        self._wal_records = 0
+        self._checkpoint_lsn = self._lsn
+        self._pending_since = None
+
+    def _fsync_dir(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Each write holds the lock across applying and logging it, so the log
+    # order is the order writes were applied in; a due fsync runs after
+
+    def put(self, key, value):
+        with self._lock:
+            super().put(key, value)
+            sync = self._log(OP_PUT, key, value)
+        if sync:
+            self.flush()
+
+    def delete(self, key):
+        with self._lock:
+            super().delete(key)
+            sync = self._log(OP_DELETE, key)
+        if sync:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            snapshot_id = super().snapshot()
+            sync = self._log(OP_SNAPSHOT, snapshot_id)
+        if sync:
+            self.flush()
+        return snapshot_id
+
+    def release(self, snapshot_id):
+        with self._lock:
+            super().release(snapshot_id)
+            sync = self._log(OP_RELEASE, snapshot_id)
+        if sync:
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = super().stats()
+            stats["wal_records"] = self._wal_records
+            stats["unsynced_records"] = self._pending_records
+            stats["checkpoint_lsn"] = self._checkpoint_lsn
+            return stats
+
+    def close(self):
+        with self._lock:
+            wal = self._wal
+            if wal is None:
+                return
+            self._wal = None
+            self._pending_records = 0
+            self._pending_since = None
+            self._wakeup.notify()
+        self._flusher.join()
+        with self._io_lock:
+            os.fsync(wal.fileno())
+            wal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 def findSubstring(s: str, words: list[str]) -> list[int]:
     if not s or not words:
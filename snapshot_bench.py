@@ -0,0 +1,101 @@
+"""
+Reader throughput of SnapshotMap under concurrent write load.
+
+--readers threads call get(key, snapshot_id) against recent snapshots for
+--seconds, first with no writer, then while one writer thread keeps
+putting, deleting and taking snapshots. The same is done with a
+coarse-locked map, where readers also take the writer lock, to show what
+lock-free snapshot reads buy.
+
+python snapshot_bench.py --readers 8 --keys 100000 --seconds 3
+"""
+import argparse
+import random
+import threading
+import time
+
+from snapshot import SnapshotMap
+
+
+class CoarseLockedMap(SnapshotMap):
+    """Baseline: every read serializes with the writers too."""
+
+    def get(self, key, snapshot_id=None):
+        with self._lock:
+            return super().get(key, snapshot_id)
+
+
+def run(map_class, keys, readers, seconds, writers):
+    snapshots = []
+    m = map_class()
+    for key in range(keys):
+        m.put(key, key)
+    snapshots.append(m.snapshot())
+
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+
+    def reader(index):
+        rng = random.Random(index)
+        n = 0
+        while not stop.is_set():
+            # A batch between checks keeps the stop test out of the measurement
+            snapshot_id = snapshots[-1]
+            for _ in range(1000):
+                try:
+                    m.get(rng.randrange(keys), snapshot_id)
+                except KeyError:
+                    pass
+            n += 1000
+        reads[index] = n
+
+    def writer():
+        rng = random.Random(-1)
+        n = 0
+        while not stop.is_set():
+            key = rng.randrange(keys)
+            if rng.random() < 0.1:
+                try:
+                    m.delete(key)
+                except KeyError:
+                    pass
+            else:
+                m.put(key, n)
+            n += 1
+            if n % 1000 == 0:
+                # Keep a few recent snapshots live and release older ones
+                snapshots.append(m.snapshot())
+                if len(snapshots) > 4:
+                    m.release(snapshots.pop(0))
+        writes[0] = n
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / seconds, writes[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    for name, map_class in (("lock-free reads", SnapshotMap), ("coarse lock", CoarseLockedMap)):
+        idle_reads, _ = run(map_class, args.keys, args.readers, args.seconds, writers=0)
+        busy_reads, writes = run(map_class, args.keys, args.readers, args.seconds, writers=1)
+        print(
+            f"{name:16} reads/s idle {idle_reads:12,.0f}  under writes {busy_reads:12,.0f}"
+            f" ({busy_reads / idle_reads:.0%})  writes/s {writes:10,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,308 @@
-def split(s, vocab):
-    # Base case 1: if the whole string is empty, return empty list
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+
+
+class CompiledVocab:
+    """Trie over a vocabulary, built once and reused across split() calls.
+
+    Edges live in one flat dict keyed by (node << 21) | ord(char), which is
+    much smaller than a dict per node. Walking it from a start position finds
+    every vocab match in one pass without slicing the input.
+    """
+
+    def __init__(self, words):
+        # node 0 is the root; _terminal[node] is 1 if a word ends there
+        self._edges = {}
+        self._terminal = bytearray(1)
+        self._count = 0
+        self.max_len = 0
+
+        for word in words:
+            node = 0
+            for ch in word:
+                edge = (node << 21) | ord(ch)
+                child = self._edges.get(edge)
+                if child is None:
+                    child = len(self._terminal)
+                    self._terminal.append(0)
+                    self._edges[edge] = child
+                node = child
+            if word and not self._terminal[node]:
+                self._terminal[node] = 1
+                self._count += 1
+                self.max_len = max(self.max_len, len(word))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, word):
+        node = 0
+        for ch in word:
+            node = self._edges.get((node << 21) | ord(ch))
+            if node is None:
+                return False
+        return bool(word) and bool(self._terminal[node])
+
+    def match_ends(self, s, start):
+        """Yield every end index j such that s[start:j] is in the vocab, in increasing order."""
+        edges = self._edges
+        terminal = self._terminal
+        node = 0
+        for j in range(start, min(len(s), start + self.max_len)):
+            node = edges.get((node << 21) | ord(s[j]))
+            if node is None:
+                return
+            if terminal[node]:
+                yield j + 1
+
+    def nbytes(self):
+        """Approximate memory held by the trie, in bytes (edge keys and values included)."""
+        edges = self._edges
+        total = sys.getsizeof(edges) + sys.getsizeof(self._terminal)
+        total += sum(sys.getsizeof(edge) for edge in edges)
+        total += sum(sys.getsizeof(child) for child in edges.values())
+        return total
+
+
+# On-disk vocab layout (little-endian):
+#   header:  magic, word count, longest word in chars
+#   offsets: count + 1 uint32 byte offsets into the blob
+#   blob:    the UTF-8 encoded words, sorted bytewise and concatenated
+_VOCAB_MAGIC = b"SPLTVOC1"
+_VOCAB_HEADER = struct.Struct("<8sII")
+
+
+def save_vocab(words, path):
+    """Write words to path in the sorted, offset-indexed format read by MappedVocab."""
+    encoded = sorted({word.encode("utf-8") for word in words if word})
+    max_len = max((len(word.decode("utf-8")) for word in encoded), default=0)
+
+    offsets = array("I", [0])
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    with open(path, "wb") as f:
+        f.write(_VOCAB_HEADER.pack(_VOCAB_MAGIC, len(encoded), max_len))
+        f.write(offsets.tobytes())
+        for word in encoded:
+            f.write(word)
+
+
+class MappedVocab:
+    """Read-only vocab served straight from a save_vocab() file through mmap.
+
+    Opening it only maps the file, so start-up cost doesn't grow with the
+    vocab and forked workers share the same physical pages. Lookups binary
+    search the mapped buffer and never build Python objects per word.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count, self.max_len = _VOCAB_HEADER.unpack_from(self._mm, 0)
+        if magic != _VOCAB_MAGIC:
+            raise ValueError(f"{path} is not a vocab file")
+
+        offsets_start = _VOCAB_HEADER.size
+        self._blob_start = offsets_start + 4 * (self._count + 1)
+        if sys.byteorder == "little":
+            self._offsets = memoryview(self._mm)[offsets_start:self._blob_start].cast("I")
+        else:
+            offsets = array("I", self._mm[offsets_start:self._blob_start])
+            offsets.byteswap()
+            self._offsets = offsets
+
+    # mmap objects can't be pickled, so workers reopen the file by path
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def _word(self, i):
+        return self._mm[self._blob_start + self._offsets[i]:self._blob_start + self._offsets[i + 1]]
+
+    def __contains__(self, word):
+        target = word.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self._count and self._word(lo) == target
+
+    def _byte_at(self, i, depth):
+        # -1 for words too short to have this byte, which sort before longer ones
+        start = self._offsets[i] + depth
+        if start >= self._offsets[i + 1]:
+            return -1
+        return self._mm[self._blob_start + start]
+
+    def _narrow(self, lo, hi, depth, byte):
+        # First index in [lo, hi) whose byte at depth is >= byte. All words in
+        # the range share the same first depth bytes, so that byte is sorted.
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._byte_at(mid, depth) < byte:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def match_ends(self, s, start):
+        """Yield every end index j such that s[start:j] is in the vocab, in increasing order."""
+        data = s[start:start + self.max_len].encode("utf-8")
+        offsets = self._offsets
+        lo, hi = 0, self._count
+        chars = 0
+        for depth, byte in enumerate(data):
+            # Words in [lo, hi) all start with data[:depth]; keep those whose
+            # next byte matches too
+            lo = self._narrow(lo, hi, depth, byte)
+            hi = self._narrow(lo, hi, depth, byte + 1)
+            if lo == hi:
+                return
+            # Count characters by their lead bytes, skipping UTF-8 continuations
+            if byte & 0xC0 != 0x80:
+                chars += 1
+            # The shortest remaining word sorts first; an exact match ends here
+            if offsets[lo + 1] - offsets[lo] == depth + 1:
+                yield start + chars
+
+
+def split(s, vocab, max_len=None):
+    # Base case: if the whole string is empty, return empty list
     if s == "":
         return []
 
-    # Initialize the best result as None (to keep track of the minimal split)
-    best = None
+    # A compiled vocab finds all matches at a position in one trie walk;
+    # any other container is probed one prefix slice at a time
+    match_ends = getattr(vocab, "match_ends", None)
+    if match_ends is None:
+        # Without max_len, probes reach to the end of s rather than scanning
+        # the vocab for its longest word on every call. Pass the longest word
+        # length, or a CompiledVocab that knows it, to bound them tighter.
+        if max_len is None:
+            max_len = len(s)
+
+        def match_ends(s, i):
+            for j in range(i + 1, min(len(s), i + max_len) + 1):
+                if s[i:j] in vocab:
+                    yield j
+
+    n = len(s)
+
+    # best[i] = (number of pieces, end of first piece) for the suffix s[i:],
+    # or None if s[i:] cannot be split
+    best = [None] * (n + 1)
+    best[n] = (0, n)
+
+    # Fill from the right so every suffix is solved before it is needed
+    for i in range(n - 1, -1, -1):
+        for j in match_ends(s, i):
+            rest = best[j]
+            if rest is None:
+                continue
+            count = rest[0] + 1
+            # Strict < keeps the shortest first piece on ties, the same choice
+            # the recursive version made by trying prefixes shortest-first
+            if best[i] is None or count < best[i][0]:
+                best[i] = (count, j)
+
+    # Return None if no valid split was found
+    if best[0] is None:
+        return None
+
+    # Walk the chosen piece boundaries to rebuild the split
+    pieces = []
+    i = 0
+    while i < n:
+        j = best[i][1]
+        pieces.append(s[i:j])
+        i = j
+    return pieces
+
+
+# Per-process splitter set up once by _init_worker, so the vocab is shipped
+# to each pool worker a single time rather than with every task
+_worker_split = None
+
+
+def _cached_splitter(vocab, cache_size):
+    # Results are cached as tuples so a cached split can't be mutated by a caller
+    @lru_cache(maxsize=cache_size)
+    def cached_split(s):
+        pieces = split(s, vocab)
+        return None if pieces is None else tuple(pieces)
+
+    return cached_split
+
+
+def _init_worker(vocab, cache_size):
+    global _worker_split
+    _worker_split = _cached_splitter(vocab, cache_size)
+
+
+def _split_chunk_in_worker(chunk):
+    return [_worker_split(s) for s in chunk]
+
 
-    # Try every possible prefix from s
-    for i in range(1, len(s) + 1):
-        prefix = s[:i]
+def split_many(strings, vocab, workers=None, chunksize=256, cache_size=65536):
+    """Split every string in an iterable, yielding results in input order.
 
-        # Check if prefix is in vocabulary
-        if prefix in vocab:
-            # Recursively split the rest of the string
-            rest = split(s[i:], vocab)
+    Work is spread over a process pool of `workers` processes (os.cpu_count()
+    by default), handing out `chunksize` strings per task. Each process keeps
+    an LRU of up to `cache_size` results, so repeated inputs are split once.
+    Only a few chunks per worker are read ahead of what has been yielded, so
+    inputs of any length stream through in bounded memory. With workers=1
+    everything runs in the calling process.
+    """
+    # Compile up front so workers receive the trie instead of rebuilding it
+    if not hasattr(vocab, "match_ends"):
+        vocab = CompiledVocab(vocab)
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-            # If rest is not None (valid split), try to update best result
-            if rest is not None:
-                candidate = [prefix] + rest
-                # Update best if it's the first found or shorter than current best
-                if best is None or len(candidate) < len(best):
-                    best = candidate
+    if workers == 1:
+        results = map(_cached_splitter(vocab, cache_size), strings)
+        for pieces in results:
+            yield None if pieces is None else list(pieces)
+        return
 
-    # Return the best valid split (or None if not found)
-    return best
+    # Pool.imap would read the whole input into its task queue up front;
+    # instead keep at most this many chunks queued or running
+    max_in_flight = 2 * workers
+    strings = iter(strings)
+    in_flight = deque()
+    with Pool(workers, initializer=_init_worker, initargs=(vocab, cache_size)) as pool:
+        while True:
+            while len(in_flight) < max_in_flight:
+                chunk = list(islice(strings, chunksize))
+                if not chunk:
+                    break
+                in_flight.append(pool.apply_async(_split_chunk_in_worker, (chunk,)))
+            if not in_flight:
+                return
+            for pieces in in_flight.popleft().get():
+                yield None if pieces is None else list(pieces)
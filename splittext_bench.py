@@ -0,0 +1,102 @@
+"""
+Compare vocab start-up cost for splittext.split.
+
+Each loading strategy runs in a fresh subprocess that reports how long the
+vocab took to become usable and the process's RSS afterwards:
+
+  set       read words.txt into a Python set
+  compiled  read words.txt and build a CompiledVocab
+  mapped    open vocab.bin (save_vocab format) with MappedVocab
+
+python splittext_bench.py --words 500000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import time
+
+from splittext import CompiledVocab, MappedVocab, save_vocab, split
+
+
+def rss_mb():
+    # Current RSS where /proc exists; peak RSS elsewhere. Linux carries
+    # ru_maxrss over from the parent across exec, so it's only a fallback.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    if sys.platform == "darwin":
+        rss /= 1024
+    return rss / 1024
+
+
+def load(mode, workdir):
+    if mode == "mapped":
+        return MappedVocab(os.path.join(workdir, "vocab.bin"))
+    with open(os.path.join(workdir, "words.txt")) as f:
+        words = f.read().split()
+    if mode == "compiled":
+        return CompiledVocab(words)
+    return set(words)
+
+
+def child(mode, workdir):
+    baseline = rss_mb()
+    start = time.perf_counter()
+    vocab = load(mode, workdir)
+    load_s = time.perf_counter() - start
+
+    # One real split so lazily touched pages are counted too
+    split("thequickbrownfoxjumpsoverthelazydog" * 4, vocab)
+    print(json.dumps({
+        "mode": mode,
+        "load_s": round(load_s, 4),
+        "rss_mb": round(rss_mb(), 1),
+        "vocab_rss_mb": round(rss_mb() - baseline, 1),
+    }))
+
+
+def generate(num_words, workdir):
+    random.seed(0)
+    words = {
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(1, 12)))
+        for _ in range(num_words)
+    }
+    with open(os.path.join(workdir, "words.txt"), "w") as f:
+        f.write("\n".join(sorted(words)))
+    save_vocab(words, os.path.join(workdir, "vocab.bin"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--workdir", default="splittext_bench_data")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.workdir)
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    generate(args.words, args.workdir)
+    for mode in ("set", "compiled", "mapped"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--workdir", args.workdir],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        print(out.strip())
+
+
+if __name__ == "__main__":
+    main()
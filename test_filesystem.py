@@ -0,0 +1,240 @@
+"""Randomized checks of the block cache, allocator and file table against plain references."""
+import io
+import random
+
+import pytest
+
+from filesystem import BLOCK_SIZE, ExtentAllocator, FileTable, Filesystem, Node
+
+
+def random_bytes(rng, n):
+    return bytes(rng.choice(b"abcdefgh") for _ in range(n))
+
+
+def make_fs(num_blocks, cache_blocks=0):
+    return Filesystem([Node("\0" * BLOCK_SIZE)] * num_blocks, cache_blocks)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_block_cache_matches_uncached(seed):
+    rng = random.Random(seed)
+    num_blocks = rng.randint(1, 40)
+    size = num_blocks * BLOCK_SIZE
+    fs = make_fs(num_blocks, cache_blocks=rng.randint(1, 8))
+    ref = bytearray(size)
+    for _ in range(300):
+        pos = rng.randrange(size)
+        n = rng.randint(0, min(3 * BLOCK_SIZE, size - pos))
+        op = rng.random()
+        if op < 0.5:
+            data = random_bytes(rng, n)
+            fs.write(pos, data)
+            ref[pos:pos + n] = data
+        elif op < 0.9:
+            assert fs.read(pos, n) == ref[pos:pos + n]
+        else:
+            fs.flush()
+            assert fs.cache.dirty_blocks == 0
+            assert fs.data == ref
+        assert len(fs.cache.blocks) <= fs.cache.capacity
+    fs.flush()
+    assert fs.data == ref
+
+
+def test_block_cache_writes_back_adjacent_dirty_blocks_together():
+    fs = make_fs(16, cache_blocks=16)
+    fs.write(2 * BLOCK_SIZE, b"x" * 4 * BLOCK_SIZE)
+    fs.write(10 * BLOCK_SIZE, b"y")
+    fs.flush()
+    assert fs.cache.writebacks == 2
+    assert fs.data[2 * BLOCK_SIZE:6 * BLOCK_SIZE] == b"x" * 4 * BLOCK_SIZE
+
+
+def test_image_round_trip(tmp_path):
+    path = str(tmp_path / "fs.img")
+    rng = random.Random(0)
+    data = random_bytes(rng, 100 * BLOCK_SIZE)
+    with Filesystem.create_image(path, 100, cache_blocks=4) as fs:
+        fs.write(0, data)
+    with Filesystem.open_image(path) as fs:
+        assert fs.num_blocks == 100
+        assert fs.read(0, len(data)) == data
+
+
+
+def free_runs(free):
+    """Maximal runs of free blocks as {start: length}."""
+    runs = {}
+    for block in sorted(free):
+        if block - 1 in free:
+            continue
+        length = 1
+        while block + length in free:
+            length += 1
+        runs[block] = length
+    return runs
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_allocator_matches_free_set(seed):
+    rng = random.Random(seed)
+    num_blocks = rng.randint(1, 300)
+    allocator = ExtentAllocator(num_blocks)
+    free = set(range(num_blocks))
+    owned = []  # allocated extents
+    for _ in range(300):
+        op = rng.random()
+        if op < 0.45:
+            n = rng.randint(1, max(1, num_blocks // 4))
+            if n > len(free):
+                with pytest.raises(ValueError):
+                    allocator.allocate(n)
+                continue
+            fits = [length for length in free_runs(free).values() if length >= n]
+            extents = allocator.allocate(n)
+            assert sum(length for _, length in extents) == n
+            if fits:
+                # Best fit: one extent, from the smallest run that holds it
+                [(start, _)] = extents
+                assert free_runs(free)[start] == min(fits)
+            for start, length in extents:
+                blocks = set(range(start, start + length))
+                assert blocks <= free
+                free -= blocks
+            owned += extents
+        elif op < 0.6 and owned:
+            start, length = owned.pop(rng.randrange(len(owned)))
+            n = rng.randint(1, 10)
+            grown = allocator.extend(start, length, n)
+            assert grown == min(n, free_runs(free).get(start + length, 0))
+            free -= set(range(start + length, start + length + grown))
+            owned.append((start, length + grown))
+        elif owned:
+            start, length = owned.pop(rng.randrange(len(owned)))
+            # Free a piece from either end, or all of it
+            drop = rng.randint(1, length)
+            if rng.random() < 0.5:
+                allocator.free(start, drop)
+                if drop < length:
+                    owned.append((start + drop, length - drop))
+                free |= set(range(start, start + drop))
+            else:
+                allocator.free(start + length - drop, drop)
+                if drop < length:
+                    owned.append((start, length - drop))
+                free |= set(range(start + length - drop, start + length))
+        assert allocator.free_blocks == len(free)
+        assert all(allocator.is_used(block) != (block in free) for block in range(num_blocks))
+        assert allocator._lengths == free_runs(free)
+
+
+def check_files(table, ref):
+    used = set()
+    for name, data in ref.items():
+        f = table.open(name)
+        assert f.size == len(data)
+        assert f.read(0, len(data)) == data
+        for start, length in f.extents:
+            blocks = set(range(start, start + length))
+            assert not blocks & used
+            used |= blocks
+    assert len(used) + table.allocator.free_blocks == table.fs.num_blocks
+
+
+def fits(table, ref, name, size):
+    blocks = -(-size // BLOCK_SIZE)
+    blocks += sum(-(-len(data) // BLOCK_SIZE) for other, data in ref.items() if other != name)
+    return blocks <= table.fs.num_blocks
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_file_table_matches_dict_of_bytes(seed):
+    rng = random.Random(seed)
+    table = FileTable(make_fs(rng.randint(8, 200)))
+    table.preallocate = rng.choice([0, 4, 1024])
+    ref = {}
+    for _ in range(300):
+        name = rng.choice("abcd")
+        op = rng.random()
+        if name not in ref:
+            table.create(name)
+            ref[name] = b""
+            continue
+        f = table.open(name)
+        if op < 0.05:
+            table.delete(name)
+            del ref[name]
+            continue
+        if op < 0.2:
+            size = rng.randint(0, len(ref[name]) + 40)
+            new = ref[name][:size] + bytes(max(0, size - len(ref[name])))
+            change = lambda: f.truncate(size)
+        else:
+            pos = rng.randint(0, len(ref[name]) + 10) if op < 0.5 else len(ref[name])
+            data = random_bytes(rng, rng.randint(0, 30))
+            old = ref[name] + bytes(max(0, pos - len(ref[name])))
+            new = old[:pos] + data + old[pos + len(data):]
+            change = lambda: f.write(pos, data)
+        # Reserved slack never stands in the way of data that fits
+        if fits(table, ref, name, len(new)):
+            change()
+            ref[name] = new
+        else:
+            with pytest.raises(ValueError):
+                change()
+        check_files(table, ref)
+    assert table.list() == sorted(ref)
+
+
+def test_files_appended_in_turn_stay_in_few_extents():
+    table = FileTable(make_fs(1 << 14))
+    a, b = table.create("a"), table.create("b")
+    for _ in range(1000):
+        a.append(b"x" * 64)
+        b.append(b"y" * 64)
+    assert len(a.extents) <= 20 and len(b.extents) <= 20
+    a.truncate(10)
+    b.truncate(0)
+    assert table.allocator.free_blocks == table.fs.num_blocks - 2
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_readv_writev_match_one_by_one(seed):
+    rng = random.Random(seed)
+    num_blocks = rng.randint(1, 30)
+    size = num_blocks * BLOCK_SIZE
+    cache_blocks = rng.choice([0, 2, 64])
+    fs, ref = make_fs(num_blocks, cache_blocks), make_fs(num_blocks)
+    for _ in range(50):
+        # Clustered positions give ranges that overlap, touch or share a block
+        def pos_and_length():
+            pos = rng.randrange(size)
+            return pos, rng.randint(0, min(2 * BLOCK_SIZE, size - pos))
+
+        writes = []
+        for _ in range(rng.randint(0, 6)):
+            pos, n = pos_and_length()
+            writes.append((pos, random_bytes(rng, n)))
+        fs.writev(writes)
+        for pos, data in writes:
+            ref.write(pos, data)
+
+        ranges = [pos_and_length() for _ in range(rng.randint(0, 6))]
+        assert [bytes(view) for view in fs.readv(ranges)] == [bytes(ref.read(pos, n)) for pos, n in ranges]
+    fs.flush()
+    assert bytes(fs.data) == bytes(ref.data)
+
+
+def test_writev_touches_each_block_once():
+    fs = make_fs(8, cache_blocks=8)
+    fs.writev([(0, b"ab"), (2, b"cd"), (5, b"e"), (20, b"f")])
+    # Two spans: bytes 0-5 in block 0, and byte 20 in block 2
+    assert fs.cache.misses == 2
+    assert bytes(fs.read(0, 8)) == b"abcd\0e\0\0"
+
+
+def test_dump_streams_in_chunks():
+    fs = Filesystem([Node("abcdefgh"), Node("ijklmnop"), Node("qrstuvwx")])
+    out = io.StringIO()
+    fs.dump(out, chunk_blocks=2)
+    assert out.getvalue() == "[[a,b,c,d,e,f,g,h], [i,j,k,l,m,n,o,p], [q,r,s,t,u,v,w,x]]\n"
@@ -0,0 +1,127 @@
+"""Regression checks for InMemoryDB scans and persistence."""
+import os
+import random
+import time
+
+import pytest
+
+from in_memory_db import InMemoryDB
+
+
+def test_iter_scan_survives_reaping_mid_iteration():
+    db = InMemoryDB()
+    db.set_with_ttl(1, "k", "a", 1, 4)
+    db.set(1, "k", "b", 2)
+    db.set(1, "k", "c", 3)
+    fields = []
+    for field, _ in db.iter_scan(2, "k"):
+        fields.append(field)
+        # Reaps "a" out of the index the iterator is walking
+        db.get(10, "other", "x")
+    assert fields == ["a", "b", "c"]
+
+
+def test_iter_scan_sees_fields_added_ahead():
+    db = InMemoryDB()
+    for field in "bdf":
+        db.set(1, "k", field, 0)
+    fields = []
+    for field, _ in db.iter_scan(1, "k"):
+        fields.append(field)
+        if field == "b":
+            db.set(1, "k", "a", 0)
+            db.set(1, "k", "c", 0)
+    assert fields == ["b", "c", "d", "f"]
+
+
+def test_scan_page_rejects_empty_pages():
+    db = InMemoryDB()
+    db.set(1, "k", "t0", 0)
+    with pytest.raises(ValueError):
+        db.scan_page(1, "k", limit=0)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+@pytest.mark.parametrize("fsync", ["interval", "never"])
+def test_aof_survives_process_exit_without_close(tmp_path, fsync):
+    path = str(tmp_path / "db.aof")
+    pid = os.fork()
+    if pid == 0:
+        db = InMemoryDB(path, fsync=fsync, fsync_ms=100)
+        for i in range(5):
+            db.set(1, "k", f"f{i}", i)
+        time.sleep(0.3)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    db = InMemoryDB(path)
+    assert db.scan(2, "k") == [f"f{i}({i})" for i in range(5)]
+    db.close()
+
+
+def test_interval_fsync_runs_without_further_writes(tmp_path):
+    db = InMemoryDB(str(tmp_path / "db.aof"), fsync="interval", fsync_ms=10)
+    db.set(1, "k", "f", 1)
+    assert db._unsynced
+    time.sleep(0.2)
+    assert not db._unsynced
+    db.close()
+
+
+def stored(db):
+    return {(key, field): entry for key, fields in db.db.items() for field, entry in fields.items()}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_advance_matches_reference(seed):
+    rng = random.Random(seed)
+    db = InMemoryDB()
+    ref = {}  # {(key, field): (val, expire)}, expired entries included
+    saved = []  # ref before each open transaction
+    t = 0
+    for _ in range(1500):
+        t += rng.choice([0, 0, 1, 3])
+        key, field = rng.choice("ab"), rng.choice("wxyz")
+        op = rng.random()
+        if op < 0.3:
+            ttl = rng.randint(1, 20)
+            db.set_with_ttl(t, key, field, op, ttl)
+            ref[key, field] = (op, t + ttl)
+        elif op < 0.45:
+            db.set(t, key, field, op)
+            ref[key, field] = (op, None)
+        elif op < 0.55:
+            val, expire = ref.get((key, field), (None, None))
+            alive = val is not None and (expire is None or t < expire)
+            # An absent or expired field compares equal to None
+            assert db.compare_and_del(t, key, field, val if alive else None)
+            ref.pop((key, field), None)
+        elif op < 0.6:
+            db.begin()
+            saved.append(dict(ref))
+        elif op < 0.65 and saved:
+            db.rollback()
+            ref = saved.pop()
+        elif op < 0.7 and saved:
+            db.commit()
+            saved.clear()
+        elif op < 0.85:
+            # Evicts exactly the stored fields that have expired by t
+            expired = {item for item, (_, expire) in stored(db).items() if expire is not None and expire <= t}
+            limit = rng.choice([None, 1, 5])
+            evicted = 0
+            while True:
+                n = db.advance(t, limit)
+                assert limit is None or n <= limit
+                evicted += n
+                if not db._expiry or db._expiry[0][0] > t:
+                    break
+            assert evicted == len(expired)
+            assert not expired & set(stored(db))
+        for (k, f), (val, expire) in ref.items():
+            if expire is None or t < expire:
+                assert db.get(t, k, f) == val
+        live = {item for item, (_, expire) in ref.items() if expire is None or t < expire}
+        assert live <= set(stored(db))
+        # Stale heap entries are rebuilt away once they dominate
+        ttl_fields = sum(expire is not None for _, expire in stored(db).values())
+        assert len(db._expiry) <= 2 * ttl_fields + 2 * 64 + 2
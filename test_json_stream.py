@@ -0,0 +1,238 @@
+"""Randomized checks of IncrementalValidator against json plus a full schema check."""
+import json
+import random
+
+import pytest
+
+from json_stream import IncrementalValidator, SchemaMismatch
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "code": {"type": "string"},
+        "lines": {"type": "integer"},
+        "score": {"type": ["number", "null"]},
+        "ok": {"type": "boolean"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "child": {"$ref": "#/$defs/Child"},
+    },
+    "required": ["code"],
+    "additionalProperties": False,
+    "$defs": {
+        "Child": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "children": {"type": "array", "items": {"$ref": "#/$defs/Child"}},
+            },
+            "required": ["name"],
+            "additionalProperties": {"type": "number"},
+        }
+    },
+}
+
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def resolve(schema):
+    while "$ref" in schema:
+        target = SCHEMA
+        for part in schema["$ref"][2:].split("/"):
+            target = target[part]
+        schema = target
+    return schema
+
+
+def matches(value, schema):
+    """Reference: the subset of JSON schema the validator checks, on a parsed value."""
+    schema = resolve(schema)
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        # Integers and floats are not told apart, as in the validator
+        if not any(is_number if t in ("number", "integer") else isinstance(value, TYPES[t]) for t in types):
+            return False
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        extra = schema.get("additionalProperties", True)
+        for key, item in value.items():
+            if key in properties:
+                if not matches(item, properties[key]):
+                    return False
+            elif extra is False or isinstance(extra, dict) and not matches(item, extra):
+                return False
+        return all(name in value for name in schema.get("required", []))
+    if isinstance(value, list):
+        return all(matches(item, schema.get("items", {})) for item in value)
+    return True
+
+
+def reject_constant(name):
+    raise ValueError(name)
+
+
+def reference(text):
+    """Whether text holds one JSON value that matches SCHEMA."""
+    try:
+        value = json.loads(text, parse_constant=reject_constant)
+    except ValueError:
+        return False
+    return matches(value, SCHEMA)
+
+
+def random_string(rng):
+    return "".join(rng.choice('ab "\\\né☃') for _ in range(rng.randint(0, 5)))
+
+
+def random_json(rng, depth=0):
+    kind = rng.choice(["string", "number", "bool", "null"] + ["object", "array"] * (depth < 2))
+    if kind == "string":
+        return random_string(rng)
+    if kind == "number":
+        return rng.choice([0, -3, 12, 2.5, -0.125, 1e21])
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    if kind == "array":
+        return [random_json(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return {random_string(rng): random_json(rng, depth + 1) for _ in range(rng.randint(0, 3))}
+
+
+def random_child(rng, depth):
+    child = {"name": random_string(rng)}
+    if depth < 2 and rng.random() < 0.5:
+        child["children"] = [random_child(rng, depth + 1) for _ in range(rng.randint(0, 2))]
+    if rng.random() < 0.3:
+        child["extra"] = rng.choice([1, -2.5, 3e-7])
+    return child
+
+
+def random_document(rng):
+    doc = {"code": random_string(rng)}
+    for name, make in (
+        ("lines", lambda: rng.randint(-5, 500)),
+        ("score", lambda: rng.choice([None, 0.5, -1, 7e3])),
+        ("ok", lambda: rng.random() < 0.5),
+        ("tags", lambda: [random_string(rng) for _ in range(rng.randint(0, 3))]),
+        ("child", lambda: random_child(rng, 0)),
+    ):
+        if rng.random() < 0.5:
+            doc[name] = make()
+    # Now and then a wrong type, a stray property or a missing one
+    if rng.random() < 0.2:
+        doc[rng.choice(list(doc))] = random_json(rng)
+    if rng.random() < 0.1:
+        doc[random_string(rng)] = random_json(rng)
+    if rng.random() < 0.1:
+        del doc["code"]
+    if rng.random() < 0.05:
+        return random_json(rng)
+    return doc
+
+
+def mutate(rng, text):
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(text) + 1)
+        ch = rng.choice('{}[]":,\\ -.e0123456789tfnulrsa\x01')
+        op = rng.random()
+        if op < 0.4:
+            text = text[:i] + ch + text[i:]
+        elif op < 0.7:
+            text = text[:i] + text[i + 1:]
+        else:
+            text = text[:i] + ch + text[i + 1:]
+    return text
+
+
+def validate(text, rng):
+    """Feed text in random pieces; return (accepted, characters consumed)."""
+    validator = IncrementalValidator(SCHEMA)
+    consumed = 0
+    try:
+        while consumed < len(text) and not validator.done:
+            piece = text[consumed:consumed + rng.randint(1, 8)]
+            used = validator.feed(piece)
+            consumed += used
+            if used < len(piece):
+                break
+        validator.finish()
+    except SchemaMismatch:
+        return False, consumed
+    return True, consumed
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    doc = random_document(rng)
+    text = json.dumps(
+        doc,
+        indent=rng.choice([None, 0, 2]),
+        separators=rng.choice([None, (",", ":"), (" , ", " : ")]),
+        ensure_ascii=rng.random() < 0.5,
+    )
+    if rng.random() < 0.5:
+        text = mutate(rng, text)
+    text = " " * rng.randint(0, 2) + text
+
+    accepted, consumed = validate(text + " trailing", rng)
+    if accepted:
+        # Whatever follows the closed value is left unconsumed
+        assert reference(text[:consumed])
+        assert reference(text) == (text[consumed:].strip() == "")
+    else:
+        assert not reference(text)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_valid_documents_never_fail_early(seed):
+    rng = random.Random(seed)
+    text = json.dumps({"code": random_string(rng), "child": random_child(rng, 0)})
+    validator = IncrementalValidator(SCHEMA)
+    for i, ch in enumerate(text):
+        assert not validator.done
+        assert validator.feed(ch) == 1
+    assert validator.done
+    validator.finish()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"x',  # no property starts with x
+        '{"code": 1',  # code must be a string
+        '{"child": {"name": "a", "extra": "',  # extra properties are numbers
+        '{"tags": [1',
+        '{"ok": tru ',
+        '{"lines": 01',
+        "[",
+    ],
+)
+def test_fails_on_the_first_bad_character(text):
+    validator = IncrementalValidator(SCHEMA)
+    validator.feed(text[:-1])
+    with pytest.raises(SchemaMismatch):
+        validator.feed(text[-1])
+
+
+def test_missing_required_property_fails_at_the_closing_brace():
+    validator = IncrementalValidator(SCHEMA)
+    validator.feed('{"lines": 3')
+    with pytest.raises(SchemaMismatch):
+        validator.feed("}")
+
+
+def test_top_level_number_completes_on_finish():
+    validator = IncrementalValidator({"type": "number"})
+    validator.feed("-12.5e3")
+    assert not validator.done
+    validator.finish()
+    assert validator.done
@@ -0,0 +1,55 @@
+"""Randomized checks that the sharded analyzer matches the sequential scan."""
+import random
+
+import pytest
+
+from rpc import analyze_log, analyze_log_parallel, detect_timeouts, read_log
+
+
+def write_log(path, rng, rpcs, max_gap, max_duration, unfinished=0.05):
+    events = []
+    ts = 0
+    for id in range(rpcs):
+        ts += rng.randint(0, max_gap)
+        events.append((ts, 0, id, "Start"))
+        if rng.random() >= unfinished:
+            events.append((ts + rng.randint(0, max_duration), 1, id, "End"))
+    # Sorted by timestamp; a Start sorts before an End at the same time
+    events.sort()
+    with open(path, "w") as f:
+        for ts, _, id, type in events:
+            f.write(f"{id}, {ts}, {type}\n")
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_parallel_matches_sequential(tmp_path, seed):
+    rng = random.Random(seed)
+    path = tmp_path / "rpc.log"
+    # Small gaps give many equal timestamps across shard edges; long
+    # durations carry RPCs through several shards
+    write_log(
+        path,
+        rng,
+        rpcs=rng.randint(0, 400),
+        max_gap=rng.choice([0, 1, 3, 20]),
+        max_duration=rng.choice([1, 10, 200]),
+    )
+    to = rng.randint(0, 50)
+    expected = analyze_log(path, to)
+    assert expected == list(detect_timeouts(read_log(path), to))
+    for shards in (1, 2, 3, 7, 16, 64):
+        assert analyze_log_parallel(path, to, workers=1, shards=shards) == expected
+
+
+def test_parallel_with_worker_processes(tmp_path):
+    path = tmp_path / "rpc.log"
+    write_log(path, random.Random(0), rpcs=5000, max_gap=2, max_duration=100)
+    expected = analyze_log(path, 30)
+    assert expected
+    assert analyze_log_parallel(path, 30, workers=2, shards=5) == expected
+
+
+def test_empty_log(tmp_path):
+    path = tmp_path / "rpc.log"
+    path.write_text("")
+    assert analyze_log_parallel(path, 3, workers=1, shards=4) == []
@@ -0,0 +1,326 @@
+"""Randomized checks of SnapshotMap against a map that copies on every
+snapshot, and of DurableSnapshotMap recovery after crashes."""
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from snapshot import DurableSnapshotMap, SnapshotMap, _SortedKeys
+
+
+class CopyingMap:
+    """Reference: every snapshot is a full copy of the current state."""
+
+    def __init__(self):
+        self.current = {}
+        self.snapshots = {}
+
+    def put(self, key, value):
+        self.current[key] = value
+
+    def delete(self, key):
+        del self.current[key]
+
+    def snapshot(self):
+        snapshot_id = len(self.snapshots)
+        self.snapshots[snapshot_id] = dict(self.current)
+        return snapshot_id
+
+    def get(self, key, snapshot_id=None):
+        state = self.current if snapshot_id is None else self.snapshots[snapshot_id]
+        return state[key]
+
+
+def lookup(m, key, snapshot_id=None):
+    try:
+        return m.get(key, snapshot_id)
+    except KeyError:
+        return KeyError
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_copying_map(seed):
+    rng = random.Random(seed)
+    m, ref = SnapshotMap(), CopyingMap()
+    keys = rng.randint(1, 30)
+    for _ in range(1000):
+        key = rng.randrange(keys)
+        op = rng.random()
+        if op < 0.5:
+            value = rng.randrange(10)
+            m.put(key, value)
+            ref.put(key, value)
+        elif op < 0.65:
+            if key in ref.current:
+                m.delete(key)
+                ref.delete(key)
+            else:
+                with pytest.raises(KeyError):
+                    m.delete(key)
+        elif op < 0.72:
+            assert m.snapshot() == ref.snapshot()
+        snapshot_id = rng.choice([None, *ref.snapshots])
+        assert lookup(m, key, snapshot_id) == lookup(ref, key, snapshot_id)
+
+    for snapshot_id in ref.snapshots:
+        for key in range(keys):
+            assert lookup(m, key, snapshot_id) == lookup(ref, key, snapshot_id)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_items_match_copying_map(seed):
+    rng = random.Random(seed)
+    m, ref = SnapshotMap(), CopyingMap()
+    m.ITER_CHUNK = rng.choice([1, 3, 64])
+    keys = rng.randint(1, 200)
+    for _ in range(2000):
+        key = rng.randrange(keys)
+        op = rng.random()
+        if op < 0.5:
+            m.put(key, op)
+            ref.put(key, op)
+        elif op < 0.8 and key in ref.current:
+            m.delete(key)
+            ref.delete(key)
+        elif op < 0.82:
+            ref.snapshots[m.snapshot()] = dict(ref.current)
+        elif op < 0.84 and ref.snapshots:
+            snapshot_id = rng.choice(list(ref.snapshots))
+            m.release(snapshot_id)
+            del ref.snapshots[snapshot_id]
+        snapshot_id = rng.choice([None, *ref.snapshots])
+        state = ref.current if snapshot_id is None else ref.snapshots[snapshot_id]
+        if rng.random() < 0.05:
+            pairs = list(m.items(snapshot_id))
+            assert len(pairs) == len(state) and dict(pairs) == state
+        if rng.random() < 0.05:
+            start, stop = sorted(rng.randrange(keys) for _ in range(2))
+            expected = sorted((k, v) for k, v in state.items() if start <= k < stop)
+            assert list(m.items(snapshot_id, start, stop)) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sorted_keys_match_sorted_list(seed):
+    rng = random.Random(seed)
+    _SortedKeys.BLOCK, block = rng.choice([1, 2, 4]), _SortedKeys.BLOCK
+    try:
+        initial = rng.sample(range(500), rng.randint(0, 50))
+        index, ref = _SortedKeys(initial), sorted(initial)
+        for _ in range(500):
+            key = rng.randrange(500)
+            if key in ref:
+                index.remove(key)
+                ref.remove(key)
+            else:
+                index.add(key)
+                ref.append(key)
+                ref.sort()
+            count = rng.randint(1, 20)
+            start = rng.choice([None, rng.randrange(500)])
+            low = 0 if start is None else sum(k < start for k in ref)
+            assert index.chunk(None, start, count) == ref[low:low + count]
+            after = rng.randrange(500)
+            low = sum(k <= after for k in ref)
+            assert index.chunk((after,), None, count) == ref[low:low + count]
+    finally:
+        _SortedKeys.BLOCK = block
+
+
+def test_invalid_snapshot():
+    m = SnapshotMap()
+    with pytest.raises(KeyError):
+        m.get("a", 0)
+
+
+def test_history_drains_after_last_release():
+    m = SnapshotMap()
+    for key in range(1000):
+        m.put(key, 0)
+    snapshot_id = m.snapshot()
+    for key in range(1000):
+        m.put(key, 1)
+    m.release(snapshot_id)
+    # Writes with no snapshots left keep compacting a few keys each
+    for i in range(1000):
+        m.put(i % 10, 2)
+    stats = m.stats()
+    assert stats["versions"] == 1000
+    assert stats["pending_compaction"] == 0
+
+
+def state(m):
+    return (
+        dict(m.items()),
+        {snapshot_id: dict(m.items(snapshot_id)) for snapshot_id in m._snapshots},
+        m._version,
+        m._next_snapshot_id,
+    )
+
+
+def crash(m):
+    """Drop m as a killed process would: no flush, no checkpoint."""
+    with m._lock:
+        wal, m._wal = m._wal, None
+        m._wakeup.notify()
+    m._flusher.join()
+    wal.close()
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_durable_recovery_matches(tmp_path, seed):
+    rng = random.Random(seed)
+    options = dict(
+        sync_every=rng.choice([1, 5, 1000]),
+        sync_interval=1000,
+        checkpoint_every=rng.choice([7, 50, 10**9]),
+    )
+    m = DurableSnapshotMap(tmp_path, **options)
+    for _ in range(600):
+        key = rng.randrange(15)
+        op = rng.random()
+        if op < 0.45:
+            m.put(key, rng.randrange(5))
+        elif op < 0.6 and key in m._current:
+            m.delete(key)
+        elif op < 0.68:
+            m.snapshot()
+        elif op < 0.74 and m._snapshots:
+            m.release(rng.choice(list(m._snapshots)))
+        if rng.random() < 0.03:
+            # Unsynced records were already written to the OS, so they
+            # survive the process dying; a torn record follows them
+            m.put("unsynced", 1)
+            expected = state(m)
+            crash(m)
+            with open(tmp_path / "wal", "ab") as f:
+                f.write(b"\x05\x00\x00")
+            m = DurableSnapshotMap(tmp_path, **options)
+            assert state(m) == expected
+    m.close()
+    expected = state(m)
+    m = DurableSnapshotMap(tmp_path)
+    assert state(m) == expected
+    m.close()
+
+
+def test_crash_between_checkpoint_and_log_truncation(tmp_path):
+    m = DurableSnapshotMap(tmp_path, sync_every=1)
+    for key in range(100):
+        m.put(key, key)
+    snapshot_id = m.snapshot()
+    m.delete(3)
+    wal_before = (tmp_path / "wal").read_bytes()
+    m.checkpoint()
+    m.put(200, 200)
+    expected = state(m)
+    crash(m)
+    # As if the process died after the checkpoint was renamed into place but
+    # before the log was truncated: the old records must not apply twice
+    (tmp_path / "wal").write_bytes(wal_before + (tmp_path / "wal").read_bytes())
+    m = DurableSnapshotMap(tmp_path)
+    assert state(m) == expected
+    assert m.get(3, snapshot_id) == 3
+    m.close()
+
+
+def test_crash_while_writing_checkpoint(tmp_path):
+    m = DurableSnapshotMap(tmp_path, sync_every=1)
+    for key in range(100):
+        m.put(key, key)
+    m.checkpoint()
+    m.put(1, "after")
+    expected = state(m)
+    crash(m)
+    # A half-written checkpoint never replaces the real one
+    (tmp_path / "checkpoint.tmp").write_bytes(b"SNAPCKP1\x80\x05garbage")
+    m = DurableSnapshotMap(tmp_path)
+    assert state(m) == expected
+    m.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_exit_without_close_keeps_unsynced_writes(tmp_path):
+    pid = os.fork()
+    if pid == 0:
+        m = DurableSnapshotMap(tmp_path, sync_every=1000, sync_interval=1000)
+        for key in range(10):
+            m.put(key, key)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    m = DurableSnapshotMap(tmp_path)
+    assert dict(m.items()) == {key: key for key in range(10)}
+    m.close()
+
+
+def test_flush_syncs_outside_the_writer_lock(tmp_path):
+    m = DurableSnapshotMap(tmp_path, sync_every=1000, sync_interval=1000)
+    m.put(0, 0)
+    # A writer can log while another thread's fsync holds the I/O lock
+    with m._io_lock:
+        flusher = threading.Thread(target=m.flush)
+        flusher.start()
+        m.put(1, 1)
+    flusher.join()
+    m.close()
+    m = DurableSnapshotMap(tmp_path)
+    assert dict(m.items()) == {0: 0, 1: 1}
+    m.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_idle_writes_are_synced_within_interval(tmp_path):
+    pid = os.fork()
+    if pid == 0:
+        m = DurableSnapshotMap(tmp_path, sync_every=1000, sync_interval=0.005)
+        for key in range(5):
+            m.put(key, key)
+        time.sleep(0.5)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    m = DurableSnapshotMap(tmp_path)
+    assert dict(m.items()) == {key: key for key in range(5)}
+    m.close()
+
+
+def test_items_stays_lazy_and_consistent_under_writes():
+    m = SnapshotMap()
+    m.ITER_CHUNK = 16
+    for key in range(1000):
+        m.put(key, key)
+    snapshot_id = m.snapshot()
+    seen = {}
+    for i, (key, value) in enumerate(m.items(snapshot_id)):
+        seen[key] = value
+        # Writes between chunks, including new keys ahead of the cursor
+        m.put(key + 1, -1)
+        m.put(1000 + i, -1)
+        if key % 3 == 0:
+            m.delete(key)
+    assert seen == {key: key for key in range(1000)}
+    assert list(m.items(snapshot_id, 10, 14)) == [(k, k) for k in range(10, 14)]
+
+
+def test_items_walk_survives_key_log_rebuild():
+    m = SnapshotMap()
+    m.ITER_CHUNK = 16
+    for key in range(1000):
+        m.put(key, key)
+    seen = []
+    for key, value in m.items():
+        seen.append(key)
+        # With no snapshots, deletes drop keys from the log and rebuild it
+        for later in range(key + 1, key + 10):
+            m.delete(later)
+    assert seen == list(range(0, 1000, 10))
+    assert len(m._key_log) < 1000
+
+
+def test_items_with_keys_that_do_not_compare():
+    m = SnapshotMap()
+    m.put(1, "a")
+    m.put("b", 2)
+    assert dict(m.items()) == {1: "a", "b": 2}
+    with pytest.raises(TypeError):
+        list(m.items(start=0))
@@ -0,0 +1,138 @@
+"""Randomized checks of split and its vocab types against the original recursive split."""
+import pickle
+import random
+
+import pytest
+
+from splittext import CompiledVocab, MappedVocab, save_vocab, split, split_many
+
+
+def reference_split(s, vocab):
+    """The original exponential version: fewest pieces, shortest first piece on ties."""
+    if s == "":
+        return []
+    best = None
+    for i in range(1, len(s) + 1):
+        prefix = s[:i]
+        if prefix in vocab:
+            rest = reference_split(s[i:], vocab)
+            if rest is not None:
+                candidate = [prefix] + rest
+                if best is None or len(candidate) < len(best):
+                    best = candidate
+    return best
+
+
+# Multi-byte characters check that positions count characters, not bytes
+ALPHABET = "abcé☃"
+
+
+def random_word(rng, max_len):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_len)))
+
+
+def random_case(rng):
+    words = {random_word(rng, 4) for _ in range(rng.randint(0, 25))}
+    strings = [random_word(rng, 10) for _ in range(20)]
+    # Strings made of vocab words, so most of them do split
+    pieces = sorted(word for word in words if word)
+    if pieces:
+        strings += ["".join(rng.choice(pieces) for _ in range(rng.randint(1, 4))) for _ in range(20)]
+    return words, strings
+
+
+def brute_match_ends(s, start, words):
+    return [j for j in range(start + 1, len(s) + 1) if s[start:j] in words]
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_split_matches_reference(seed):
+    rng = random.Random(seed)
+    words, strings = random_case(rng)
+    compiled = CompiledVocab(words)
+    assert len(compiled) == len(words - {""})
+    for s in strings:
+        expected = reference_split(s, words)
+        assert split(s, words) == expected
+        assert split(s, words, max_len=max(map(len, words), default=0)) == expected
+        assert split(s, compiled) == expected
+        for start in range(len(s)):
+            assert list(compiled.match_ends(s, start)) == brute_match_ends(s, start, words - {""})
+    for word in {random_word(rng, 5) for _ in range(20)} | words:
+        assert (word in compiled) == (word in words and word != "")
+
+
+def test_split_handles_long_inputs():
+    words = {"a", "aa", "aaa", "b"}
+    s = "a" * 500 + "b"
+    # The shortest first piece wins among the fewest pieces
+    expected = ["aa"] + ["aaa"] * 166 + ["b"]
+    assert split(s, words) == expected
+    assert split(s, CompiledVocab(words)) == expected
+    assert split(s + "c", CompiledVocab(words)) is None
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_split_many_matches_split_in_order(seed):
+    rng = random.Random(seed)
+    words, strings = random_case(rng)
+    # Heavy duplication, as the LRU is meant for
+    strings = [rng.choice(strings) for _ in range(300)]
+    expected = [reference_split(s, words) for s in strings]
+    results = split_many(iter(strings), words, workers=1, chunksize=rng.randint(1, 50), cache_size=8)
+    assert list(results) == expected
+
+
+def test_split_many_with_worker_processes():
+    rng = random.Random(0)
+    words, strings = random_case(rng)
+    strings = [rng.choice(strings) for _ in range(2000)]
+    expected = [reference_split(s, words) for s in strings]
+    assert list(split_many(iter(strings), words, workers=2, chunksize=7)) == expected
+    assert list(split_many([], words, workers=2)) == []
+
+
+def test_split_many_reads_input_lazily():
+    taken = []
+
+    def strings():
+        for i in range(10000):
+            taken.append(i)
+            yield "ab"
+
+    results = split_many(strings(), {"a", "b"}, workers=2, chunksize=10)
+    assert next(results) == ["a", "b"]
+    # Only a few chunks per worker are read ahead
+    assert len(taken) <= 2 * 2 * 10 + 10
+    results.close()
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_mapped_vocab_matches_set(tmp_path, seed):
+    rng = random.Random(seed)
+    words, strings = random_case(rng)
+    path = tmp_path / "vocab.bin"
+    save_vocab(words, path)
+    vocab = MappedVocab(path)
+    try:
+        assert len(vocab) == len(words - {""})
+        assert vocab.max_len == max(map(len, words), default=0)
+        for s in strings:
+            assert split(s, vocab) == reference_split(s, words)
+            for start in range(len(s)):
+                assert list(vocab.match_ends(s, start)) == brute_match_ends(s, start, words - {""})
+        for word in {random_word(rng, 5) for _ in range(20)} | words:
+            assert (word in vocab) == (word in words and word != "")
+        # Workers get it by pickle, which reopens the file by path
+        copy = pickle.loads(pickle.dumps(vocab))
+        assert all(split(s, copy) == split(s, vocab) for s in strings)
+        copy.close()
+    finally:
+        vocab.close()
+
+
+def test_mapped_vocab_rejects_other_files(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_bytes(b"not a vocab file at all")
+    with pytest.raises(ValueError):
+        MappedVocab(path)